@@ -0,0 +1,157 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable
+
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens of chat history sent per turn, by model
+HISTORY_TOKEN_BUDGETS = {
+    "gpt-4o-mini": 4000,
+    "gpt-4o": 8000,
+    "claude-3-7-sonnet-latest": 8000,
+    "deepseek-chat": 4000,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 4000
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a support conversation. Merge the previous summary "
+    "with the new messages into one concise summary that keeps names, facts, decisions "
+    "and open questions. Respond with the summary only."
+)
+
+
+def history_budget(model: str) -> int:
+    return HISTORY_TOKEN_BUDGETS.get(model, DEFAULT_HISTORY_TOKEN_BUDGET)
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content")
+    return content if isinstance(content, str) else str(content)
+
+
+@lru_cache(maxsize=10_000)
+def _cached_count(text: str) -> int:
+    return count_tokens(text)
+
+
+def message_tokens(message: dict) -> int:
+    # A few tokens of per-message overhead for the role and separators
+    return _cached_count(message_text(message)) + 4
+
+
+def openai_summarizer(client, model: str = "gpt-4o-mini", max_tokens: int = 500) -> Callable[[str, list[dict]], str]:
+    """
+    Build a summarize function that folds messages into a running summary
+    with an OpenAI chat model.
+    """
+
+    def summarize(summary: str, messages: list[dict]) -> str:
+        transcript = "\n".join(f"{m['role']}: {message_text(m)}" for m in messages)
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Previous summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+                    },
+                ],
+                temperature=0,
+                max_tokens=max_tokens,
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            raise Exception(f"Error summarizing history: {str(e)}")
+
+    return summarize
+
+
+class HistoryCompactor:
+    """
+    Keep the chat history sent to the model within a token budget.
+
+    Recent turns are sent verbatim. Once they exceed token_budget, the older
+    ones are folded into a running summary, leaving keep_ratio of the budget
+    of recent turns, and the summary is sent as a system message in their
+    place. Summarizing only when the budget is crossed keeps LLM calls rare
+    while the per-turn prompt stays flat.
+
+    Summaries are cached by a hash of the history they cover, so the stateless
+    history Gradio passes on every turn finds the summary made for it earlier.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str, list[dict]], str],
+        token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+        keep_ratio: float = 0.5,
+        max_summaries: int = 1000,
+    ) -> None:
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.keep_ratio = keep_ratio
+        self.max_summaries = max_summaries
+        self._summaries = OrderedDict()
+
+    @staticmethod
+    def _prefix_hashes(history: list[dict]) -> list[str]:
+        """
+        hashes[i] identifies history[:i].
+        """
+        digest = hashlib.sha256()
+        hashes = [digest.hexdigest()]
+        for message in history:
+            digest.update(f"{message.get('role')}\x00{message_text(message)}\x01".encode("utf-8"))
+            hashes.append(digest.copy().hexdigest())
+        return hashes
+
+    def _split_point(self, history: list[dict], start: int) -> int:
+        """
+        Start of the recent turns to keep verbatim: the earliest user message
+        after which at most keep_ratio of the budget remains. If even the last
+        turn is larger than that, everything is summarized.
+        """
+        keep_budget = self.token_budget * self.keep_ratio
+        used = 0
+        split = len(history)
+        for i in range(len(history) - 1, start - 1, -1):
+            used += message_tokens(history[i])
+            if used > keep_budget:
+                break
+            if history[i].get("role") == "user":
+                split = i
+        return split
+
+    def compact(self, history: list[dict]) -> list[dict]:
+        """
+        Return the messages to send in place of history.
+        """
+        hashes = self._prefix_hashes(history)
+        start, summary = 0, None
+        for i in range(len(history), 0, -1):
+            if hashes[i] in self._summaries:
+                start, summary = i, self._summaries[hashes[i]]
+                self._summaries.move_to_end(hashes[i])
+                break
+
+        recent_tokens = sum(message_tokens(m) for m in history[start:])
+        if recent_tokens > self.token_budget:
+            split = self._split_point(history, start)
+            summary = self.summarize(summary, history[start:split])
+            self._summaries[hashes[split]] = summary
+            if len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+            logger.info(
+                f"Summarized {split - start} messages ({recent_tokens} recent tokens over budget {self.token_budget})"
+            )
+            start = split
+
+        messages = history[start:]
+        if summary:
+            messages = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + messages
+        return messages
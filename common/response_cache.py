@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+
+def request_key(request: dict) -> str:
+    """
+    Canonical hash of a chat request (model, messages, response_format, ...).
+    """
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def request_text(request: dict) -> str:
+    """
+    The message contents of a request, used for similarity lookups.
+    """
+    return "\n".join(f"{m['role']}: {m['content']}" for m in request["messages"] if isinstance(m.get("content"), str))
+
+
+class ResponseCache:
+    """
+    Persistent cache of chat completions.
+
+    Responses are looked up by an exact canonical hash of the request and,
+    when embed_fn is given, by cosine similarity of the request text against
+    earlier requests to the same model. Entries expire after ttl seconds and
+    the least recently used ones are evicted past max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str = ".response_cache.db",
+        ttl: float = None,
+        max_entries: int = 10_000,
+        embed_fn: Callable[[str], list[float]] = None,
+        similarity_threshold: float = 0.97,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+            "embedding BLOB, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else float("-inf")
+
+    def get(self, request: dict) -> str:
+        """
+        Return the cached response for the request, or None.
+        """
+        key = request_key(request)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at >= ?", (key, self._expired_before())
+            ).fetchone()
+            if row is not None:
+                self._touch(key)
+                self.hits += 1
+                return row[0]
+
+        if self.embed_fn is not None:
+            response = self._get_similar(request)
+            if response is not None:
+                return response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_similar(self, request: dict) -> str:
+        query = np.asarray(self.embed_fn(request_text(request)), dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, response, embedding FROM responses "
+                "WHERE model = ? AND embedding IS NOT NULL AND created_at >= ?",
+                (request.get("model", ""), self._expired_before()),
+            ).fetchall()
+            if not rows:
+                return None
+            matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            self._touch(rows[best][0])
+            self.similar_hits += 1
+            return rows[best][1]
+
+    def put(self, request: dict, response: str) -> None:
+        embedding = None
+        if self.embed_fn is not None:
+            vector = np.asarray(self.embed_fn(request_text(request)), dtype=np.float32)
+            # Stored normalized, so similarity is a plain dot product
+            embedding = (vector / (np.linalg.norm(vector) or 1.0)).tobytes()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, embedding, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (request_key(request), request.get("model", ""), response, embedding, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _touch(self, key: str) -> None:
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def _evict(self) -> None:
+        """
+        Drop expired entries, then the least recently used beyond max_entries.
+        """
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (self._expired_before(),))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / total if total else 0.0,
+            }
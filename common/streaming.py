@@ -0,0 +1,79 @@
+import json
+import time
+from typing import Iterable, Iterator
+
+
+def openai_deltas(stream) -> Iterator[str]:
+    """
+    Yield the non-empty text deltas of an OpenAI chat completion stream.
+    """
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def coalesce(deltas: Iterable[str], interval: float = 0.03, max_chars: int = 2048) -> Iterator[str]:
+    """
+    Group deltas into flushes, emitted every interval seconds or once
+    max_chars characters are pending, whichever comes first.
+    """
+    pending = []
+    pending_chars = 0
+    last_flush = time.monotonic()
+    for delta in deltas:
+        pending.append(delta)
+        pending_chars += len(delta)
+        now = time.monotonic()
+        if now - last_flush >= interval or pending_chars >= max_chars:
+            yield "".join(pending)
+            pending = []
+            pending_chars = 0
+            last_flush = now
+    if pending:
+        yield "".join(pending)
+
+
+def cumulative(deltas: Iterable[str], interval: float = 0.03, max_chars: int = 2048) -> Iterator[str]:
+    """
+    Yield the accumulated response after each flush, for UIs like Gradio that
+    expect the full text so far. Per-token work is a list append; the
+    cumulative string is only rebuilt once per flush.
+    """
+    parts = []
+    for flushed in coalesce(deltas, interval, max_chars):
+        parts.append(flushed)
+        yield "".join(parts)
+
+
+def benchmark(n_tokens: int = 4000, token: str = "word ") -> None:
+    """
+    Compare yielding the whole response per token against coalesced flushes.
+    The consumer JSON-encodes each update, as Gradio does when pushing it.
+    """
+
+    def fake_stream() -> Iterator[str]:
+        for _ in range(n_tokens):
+            yield token
+
+    def naive(deltas: Iterable[str]) -> Iterator[str]:
+        response = ""
+        for delta in deltas:
+            response += delta
+            yield response
+
+    for name, updates in (("per-token", naive(fake_stream())), ("coalesced", cumulative(fake_stream()))):
+        start = time.perf_counter()
+        n_updates = 0
+        n_bytes = 0
+        for update in updates:
+            n_updates += 1
+            n_bytes += len(json.dumps(update))
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>10}: {n_updates} updates, {n_bytes / 1e6:.2f} MB pushed, "
+            f"{elapsed / n_tokens * 1e6:.2f} us/token"
+        )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,39 @@
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken downloads its encoding on first use and raises offline
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken, or estimate ~4 characters per token without it.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text down to at most max_tokens tokens.
+    """
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+    return text[: max_tokens * 4]
+
+
+def split_by_tokens(text: str, max_tokens: int) -> list[str]:
+    """
+    Cut text into consecutive pieces of at most max_tokens tokens.
+    """
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return [_encoding.decode(tokens[i : i + max_tokens]) for i in range(0, len(tokens), max_tokens)] or [text]
+    size = max_tokens * 4
+    return [text[i : i + size] for i in range(0, len(text), size)] or [text]
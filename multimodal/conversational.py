@@ -1,8 +1,12 @@
 import os
+import sys
 from dotenv import load_dotenv
 from openai import OpenAI
 import gradio as gr
 import logging
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from streaming import cumulative, openai_deltas
+from history import HistoryCompactor, history_budget, openai_summarizer
 
 
 # Set up logging configuration
@@ -15,6 +19,8 @@ logger = logging.getLogger(__name__)
 
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 model = "gpt-4o-mini"
+# Older turns are summarized so each prompt carries a bounded amount of history
+history_compactor = HistoryCompactor(openai_summarizer(openai_client), token_budget=history_budget(model))
 
 def get_openai_stream(
     messages: dict,
@@ -27,10 +33,7 @@ def get_openai_stream(
             messages=messages,
             stream=True,
         )
-        result = ""
-        for chunk in response:
-            result += chunk.choices[0].delta.content or ""
-            yield result
+        yield from cumulative(openai_deltas(response))
 
     except Exception as e:
         raise Exception(f"Error getting chat completion: {str(e)}")
@@ -51,7 +54,11 @@ def chat(message: str, history: list[dict]):
     {"role": "user", "content": "the new user prompt"},
     ]   
     """
-    messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
+    messages = (
+        [{"role": "system", "content": system_message}]
+        + history_compactor.compact(history)
+        + [{"role": "user", "content": message}]
+    )
 
     print("History is:")
     print(history)
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from typing import Callable
+
+from transcript import Transcript
+from utils import (
+    fan_out,
+    get_claude_response_with_usage_async,
+    get_deepseek_response_with_usage_async,
+    get_openai_response_with_usage_async,
+)
+
+
+def print_output(model: str, label: str, text: str) -> None:
+    print(f"{model} ({label}):\n{text}\n")
+
+
+class Debate:
+    """
+    Three-way OpenAI / Claude / DeepSeek debate that runs independent steps
+    concurrently.
+
+    Within a round OpenAI and DeepSeek only read earlier rounds, so they run
+    together, and Claude starts as soon as OpenAI's reply (which it answers)
+    arrives. All three votes are independent and run together. Each output
+    is passed to on_output as soon as it arrives, and per-model latency and
+    token usage are recorded in self.records. The conversation is kept in
+    an incremental Transcript, which can be saved and restored.
+
+    Every call runs through fan_out with a timeout (Claude's covers the
+    wait for OpenAI's reply). A participant that fails or times out is
+    recorded with its error and takes a placeholder turn, so the round
+    carries on with the others.
+    """
+
+    def __init__(
+        self,
+        question: str,
+        openai_system: str,
+        claude_system: str,
+        deepseek_system: str,
+        on_output: Callable[[str, str, str], None] = print_output,
+        transcript: Transcript = None,
+        timeout: float = 120.0,
+    ) -> None:
+        self.claude_system = claude_system
+        self.on_output = on_output
+        self.timeout = timeout
+        self.records = []
+        if transcript is None:
+            # Claude takes its system prompt separately
+            transcript = Transcript(
+                {"OpenAI": openai_system, "Claude": None, "DeepSeek": deepseek_system}
+            )
+            transcript.add_round(
+                {"OpenAI": question, "Claude": question, "DeepSeek": question}
+            )
+        self.transcript = transcript
+
+    async def _step(self, model: str, label: str, call) -> str:
+        start = time.perf_counter()
+        text, usage = await call
+        self.records.append(
+            {
+                "round": label,
+                "model": model,
+                "seconds": time.perf_counter() - start,
+                **usage,
+            }
+        )
+        self.on_output(model, label, text)
+        return text
+
+    def _openai_step(self, label: str) -> asyncio.Task:
+        messages = self.transcript.view("OpenAI")
+        return asyncio.create_task(
+            self._step("OpenAI", label, get_openai_response_with_usage_async(messages))
+        )
+
+    def _claude_step(self, label: str, openai_message: str) -> asyncio.Task:
+        # Claude answers OpenAI's message from the current round
+        messages = self.transcript.view("Claude", pending=openai_message)
+        return asyncio.create_task(
+            self._step(
+                "Claude",
+                label,
+                get_claude_response_with_usage_async(self.claude_system, messages),
+            )
+        )
+
+    def _deepseek_step(self, label: str) -> asyncio.Task:
+        messages = self.transcript.view("DeepSeek")
+        return asyncio.create_task(
+            self._step(
+                "DeepSeek", label, get_deepseek_response_with_usage_async(messages)
+            )
+        )
+
+    def _failed(self, model: str, label: str, error: BaseException, start: float) -> str:
+        """
+        Record a failed or timed-out call and return the placeholder turn.
+        """
+        reason = type(error).__name__ if not str(error) else f"{type(error).__name__}: {error}"
+        self.records.append(
+            {
+                "round": label,
+                "model": model,
+                "seconds": time.perf_counter() - start,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "error": reason,
+            }
+        )
+        placeholder = f"({model} did not respond: {reason})"
+        self.on_output(model, label, placeholder)
+        return placeholder
+
+    async def _gather(self, label: str, calls: dict) -> dict:
+        """
+        Run the calls through fan_out; failures become placeholder turns.
+        """
+        start = time.perf_counter()
+        results = await fan_out(calls, timeout=self.timeout)
+        return {
+            model: self._failed(model, label, result, start) if isinstance(result, BaseException) else result
+            for model, result in results.items()
+        }
+
+    async def run_round(self, round_number: int) -> None:
+        label = f"round {round_number}"
+        openai_task = self._openai_step(label)
+
+        async def claude_after_openai() -> str:
+            # Claude answers OpenAI's reply, so it cannot go ahead without one
+            await asyncio.wait([openai_task])
+            if openai_task.cancelled() or openai_task.exception() is not None:
+                raise RuntimeError("no reply from OpenAI to answer")
+            return await self._claude_step(label, openai_task.result())
+
+        replies = await self._gather(
+            label,
+            {
+                "OpenAI": openai_task,
+                "Claude": claude_after_openai(),
+                "DeepSeek": self._deepseek_step(label),
+            },
+        )
+        self.transcript.add_round(replies)
+
+    async def vote(self, voting_prompt: str) -> dict:
+        self.transcript.add_round(
+            {"OpenAI": voting_prompt, "Claude": voting_prompt, "DeepSeek": voting_prompt}
+        )
+
+        return await self._gather(
+            "vote",
+            {
+                "OpenAI": self._openai_step("vote"),
+                "Claude": self._claude_step("vote", voting_prompt),
+                "DeepSeek": self._deepseek_step("vote"),
+            },
+        )
+
+    async def run(self, rounds: int, voting_prompt: str) -> dict:
+        # A restored transcript continues after the rounds it already holds
+        done = len(self.transcript.rounds) - 1
+        for round_number in range(done + 1, done + rounds + 1):
+            print(f"\n-----Iteration: {round_number} -----")
+            await self.run_round(round_number)
+        print("\n----- VOTING PHASE -----\n")
+        return await self.vote(voting_prompt)
+
+    def report(self) -> None:
+        """
+        Print per-model latency and token usage for each round.
+        """
+        for record in self.records:
+            print(
+                f"{record['round']:>8} {record['model']:>8}: {record['seconds']:.2f}s, "
+                f"{record['prompt_tokens']} prompt + {record['completion_tokens']} completion tokens"
+                + (f", failed ({record['error']})" if "error" in record else "")
+            )
@@ -1,5 +1,9 @@
+import os
+import sys
 import gradio as gr
 from utils import *
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from streaming import cumulative, openai_deltas
 
 
 
@@ -65,10 +69,7 @@ def get_openai_stream(
       ],
       stream=True,
         )
-        result = ""
-        for chunk in response:
-            result += chunk.choices[0].delta.content or ""
-            yield result
+        yield from cumulative(openai_deltas(response))
 
     except Exception as e:
         raise Exception(f"Error getting chat completion: {str(e)}")
@@ -1,3 +1,6 @@
+import asyncio
+
+from debate import Debate
 from utils import *
 
 # https://platform.openai.com/docs/assistants/overview
@@ -93,44 +96,9 @@ if __name__ == "__main__":
 
     question = "What is the meaning of life?"
 
-    openai_message_list = [question]
-    claude_message_list = [question]
-    deepseek_message_list = [question]
-
-    print(f"OpenAI:\n{openai_message_list[0]}\n")
-    print(f"Claude:\n{claude_message_list[0]}\n")
-    print(f"DeepSeek:\n{deepseek_message_list[0]}\n")
-
-    for i in range(3):
-        print("\n-----Iteration: ", i + 1, "-----")
-        openai_next = openai_assistant_response(
-            openai_message_list,
-            claude_message_list,
-            deepseek_message_list,
-            openai_system_message,
-        )
-        print(f"OpenAI:\n{openai_next}\n")
-        openai_message_list.append(openai_next)
-
-        claude_next = claude_assistant_response(
-            openai_message_list,
-            claude_message_list,
-            deepseek_message_list,
-            claude_system_message,
-        )
-        print(f"Claude:\n{claude_next}\n")
-        claude_message_list.append(claude_next)
-
-        deepseek_next = deepseek_assistant_response(
-            openai_message_list,
-            claude_message_list,
-            deepseek_message_list,
-            deepseek_system,
-        )
-        print(f"DeepSeek:\n{deepseek_next}\n")
-        deepseek_message_list.append(deepseek_next)
-
-    print("\n----- VOTING PHASE -----\n")
+    print(f"OpenAI:\n{question}\n")
+    print(f"Claude:\n{question}\n")
+    print(f"DeepSeek:\n{question}\n")
 
     voting_prompt = """Based on the responses to 'What is the meaning of life?', 
     this is just a fun game where you choose which AI model's answer you liked best.
@@ -138,31 +106,15 @@ if __name__ == "__main__":
     Consider which answer resonated with you personally. 
     Give ONLY the name of the candidate you voted for (OpenAI, Claude, or DeepSeek)."""
 
-    openai_message_list.append(voting_prompt)
-    claude_message_list.append(voting_prompt)
-    deepseek_message_list.append(voting_prompt)
-
-    # Get final votes
-    openai_vote = openai_assistant_response(
-        openai_message_list,
-        claude_message_list,
-        deepseek_message_list,
-        openai_system_message,
-    )
-    print(f"OpenAI's Vote:\n{openai_vote}\n")
-
-    claude_vote = claude_assistant_response(
-        openai_message_list,
-        claude_message_list,
-        deepseek_message_list,
-        claude_system_message,
-    )
-    print(f"Claude's Vote:\n{claude_vote}\n")
-
-    deepseek_vote = deepseek_assistant_response(
-        openai_message_list, claude_message_list, deepseek_message_list, deepseek_system
+    # The debate runs OpenAI and DeepSeek together in each round, starts Claude as soon as
+    # OpenAI has replied, and collects all three votes concurrently
+    debate = Debate(
+        question, openai_system_message, claude_system_message, deepseek_system
     )
-    print(f"DeepSeek's Vote:\n{deepseek_vote}\n")
+    votes = asyncio.run(debate.run(rounds=3, voting_prompt=voting_prompt))
+    debate.report()
+    # The transcript can be restored with Transcript.load to continue the conversation
+    debate.transcript.save("debate_transcript.json")
 
     # Sample Response:
     # OpenAI:
@@ -0,0 +1,67 @@
+import json
+
+
+class Transcript:
+    """
+    Shared state of a multi-agent conversation.
+
+    Every participant has its own view of the conversation, with its own
+    turns as "assistant" messages and everyone else's as "user" messages
+    prefixed with the speaker's name. Views are extended as rounds are
+    added, so a turn costs no re-formatting of earlier rounds, and the
+    formatted text of each message is shared between views.
+    """
+
+    def __init__(self, systems: dict[str, str]) -> None:
+        """
+        systems maps each participant, in speaking order, to its system
+        prompt, or to None when the provider takes the system prompt
+        separately (as Anthropic does).
+        """
+        self.systems = dict(systems)
+        self.participants = list(systems)
+        self.rounds = []
+        self._views = {
+            name: [{"role": "system", "content": system}] if system is not None else []
+            for name, system in self.systems.items()
+        }
+
+    def add_round(self, messages: dict[str, str]) -> None:
+        """
+        Append one message per participant.
+        """
+        turn = [messages[name] for name in self.participants]
+        self.rounds.append(turn)
+        for speaker, message in zip(self.participants, turn):
+            content = f"[{speaker}]: {message}"
+            for name, view in self._views.items():
+                view.append({"role": "assistant" if name == speaker else "user", "content": content})
+
+    def view(self, name: str, pending: str = None) -> list[dict]:
+        """
+        Messages to send for the participant's next turn. A pending message
+        from the current, unfinished round is added as a final user message.
+        """
+        messages = list(self._views[name])
+        if pending is not None:
+            messages.append({"role": "user", "content": pending})
+        return messages
+
+    def to_dict(self) -> dict:
+        return {"systems": self.systems, "rounds": self.rounds}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Transcript":
+        transcript = cls(data["systems"])
+        for turn in data["rounds"]:
+            transcript.add_round(dict(zip(transcript.participants, turn)))
+        return transcript
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "Transcript":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
@@ -1,9 +1,16 @@
+import asyncio
 import os
+import sys
+import weakref
+from typing import Awaitable
 
 import google.generativeai as genai
-from anthropic import Anthropic
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from response_cache import ResponseCache
 
 # Load environment variables
 load_dotenv()
@@ -28,6 +35,34 @@ genai.configure(api_key=google_api_key)
 deepseek_via_openai_client = OpenAI(
     api_key=deepseek_api_key, base_url="https://api.deepseek.com"
 )
+# Deterministic (temperature 0) OpenAI completions are reused across runs
+response_cache = ResponseCache(".response_cache.db")
+
+# Async clients share one connection pool per event loop, since pooled
+# connections cannot be reused once the loop that opened them is closed
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_clients() -> dict:
+    """
+    Return the async OpenAI, Anthropic and DeepSeek clients for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+        _async_clients[loop] = {
+            "openai": AsyncOpenAI(api_key=openai_api_key, http_client=http_client),
+            "anthropic": AsyncAnthropic(api_key=anthropic_api_key, http_client=http_client),
+            "deepseek": AsyncOpenAI(
+                api_key=deepseek_api_key,
+                base_url="https://api.deepseek.com",
+                http_client=http_client,
+            ),
+        }
+    return _async_clients[loop]
 
 
 def list_gemini_models() -> None:
@@ -64,6 +99,18 @@ def get_openai_response(
     temperature: float = 0,
     response_format: dict = None,
 ) -> str:
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "response_format": response_format,
+    }
+    cacheable = response_cache is not None and temperature == 0
+    if cacheable:
+        cached = response_cache.get(request)
+        if cached is not None:
+            return cached
+
     try:
         response = openai_client.chat.completions.create(
             model=model,
@@ -71,7 +118,10 @@ def get_openai_response(
             temperature=temperature,
             response_format=response_format,
         )
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if cacheable:
+            response_cache.put(request, content)
+        return content
 
     except Exception as e:
         raise Exception(f"Error getting chat completion: {str(e)}")
@@ -113,12 +163,167 @@ def get_deepseek_response(
         raise Exception(f"Error getting deepseek response: {str(e)}")
 
 
-def openai_assistant_response(
+async def get_gemini_response_async(
+    user_prompt: str, model: str = "gemini-2.0-flash-exp"
+) -> str:
+    try:
+        model = genai.GenerativeModel(model)
+        response = await model.generate_content_async(user_prompt)
+        return response.text
+    except Exception as e:
+        raise Exception(f"Error getting Gemini response: {str(e)}")
+
+
+async def get_openai_response_async(
+    messages: list[dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0,
+    response_format: dict = None,
+) -> str:
+    response, _ = await get_openai_response_with_usage_async(
+        messages, model, temperature, response_format
+    )
+    return response
+
+
+async def get_openai_response_with_usage_async(
+    messages: list[dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0,
+    response_format: dict = None,
+) -> tuple[str, dict]:
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "response_format": response_format,
+    }
+    cacheable = response_cache is not None and temperature == 0
+    if cacheable:
+        cached = response_cache.get(request)
+        if cached is not None:
+            return cached, {"prompt_tokens": 0, "completion_tokens": 0}
+
+    try:
+        response = await get_async_clients()["openai"].chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format=response_format,
+        )
+        content = response.choices[0].message.content
+        if cacheable:
+            response_cache.put(request, content)
+        return content, openai_usage(response)
+
+    except Exception as e:
+        raise Exception(f"Error getting chat completion: {str(e)}")
+
+
+async def get_claude_response_async(
+    system_message: str,
+    messages: list[dict],
+    model: str = "claude-3-5-sonnet-latest",
+    temperature: float = 0.7,
+    max_tokens: int = 100,
+) -> str:
+    response, _ = await get_claude_response_with_usage_async(
+        system_message, messages, model, temperature, max_tokens
+    )
+    return response
+
+
+async def get_claude_response_with_usage_async(
+    system_message: str,
+    messages: list[dict],
+    model: str = "claude-3-5-sonnet-latest",
+    temperature: float = 0.7,
+    max_tokens: int = 100,
+) -> tuple[str, dict]:
+    try:
+        message = await get_async_clients()["anthropic"].messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            system=system_message,
+            messages=messages,
+        )
+        usage = {
+            "prompt_tokens": message.usage.input_tokens,
+            "completion_tokens": message.usage.output_tokens,
+        }
+        return message.content[0].text, usage
+
+    except Exception as e:
+        raise Exception(f"Error getting anthropic response: {str(e)}")
+
+
+async def get_deepseek_response_async(
+    messages: list[dict], model: str = "deepseek-chat", temperature: float = 0.0
+) -> str:
+    response, _ = await get_deepseek_response_with_usage_async(
+        messages, model, temperature
+    )
+    return response
+
+
+async def get_deepseek_response_with_usage_async(
+    messages: list[dict], model: str = "deepseek-chat", temperature: float = 0.0
+) -> tuple[str, dict]:
+    try:
+        response = await get_async_clients()["deepseek"].chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+        )
+        return response.choices[0].message.content, openai_usage(response)
+
+    except Exception as e:
+        raise Exception(f"Error getting deepseek response: {str(e)}")
+
+
+def openai_usage(response) -> dict:
+    """
+    Token usage of an OpenAI-compatible chat completion.
+    """
+    if response.usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0}
+    return {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+    }
+
+
+async def fan_out(calls: dict[str, Awaitable[str]], timeout: float = 60.0) -> dict:
+    """
+    Await several provider calls concurrently, each with its own timeout.
+
+    Example:
+        await fan_out({
+            "OpenAI": get_openai_response_async(messages),
+            "DeepSeek": get_deepseek_response_async(messages),
+        })
+
+    Returns:
+        A dict from name to response, or to the exception (including
+        asyncio.TimeoutError) if that call failed
+    """
+
+    async def with_timeout(call: Awaitable[str]) -> str:
+        return await asyncio.wait_for(call, timeout)
+
+    results = await asyncio.gather(
+        *(with_timeout(call) for call in calls.values()), return_exceptions=True
+    )
+    return dict(zip(calls, results))
+
+
+def openai_assistant_messages(
     openai_messages: list[str],
     claude_messages: list[str],
     deepseek_messages: list[str] = None,
     openai_system: str = "",
-) -> str:
+) -> list[dict]:
 
     messages = [{"role": "system", "content": openai_system}]
 
@@ -141,16 +346,27 @@ def openai_assistant_response(
                 {"role": "user", "content": f"[DeepSeek]: {deepseek_message}"}
             )
 
+    return messages
+
+
+def openai_assistant_response(
+    openai_messages: list[str],
+    claude_messages: list[str],
+    deepseek_messages: list[str] = None,
+    openai_system: str = "",
+) -> str:
+    messages = openai_assistant_messages(
+        openai_messages, claude_messages, deepseek_messages, openai_system
+    )
     response_openai = get_openai_response(messages)
     return response_openai
 
 
-def claude_assistant_response(
+def claude_assistant_messages(
     openai_messages: list[str],
     claude_messages: list[str],
     deepseek_messages: list[str] = None,
-    claude_system: str = "",
-) -> str:
+) -> list[dict]:
     messages = []
 
     # Check if deepseek_messages is provided
@@ -166,7 +382,7 @@ def claude_assistant_response(
         ):
             messages.append({"role": "user", "content": f"[OpenAI]: {openai_message}"})
             messages.append(
-                {"role": "assistant", "content": "[Claude]: {claude_message}"}
+                {"role": "assistant", "content": f"[Claude]: {claude_message}"}
             )
             messages.append(
                 {"role": "user", "content": f"[DeepSeek]: {deepseek_message}"}
@@ -175,16 +391,28 @@ def claude_assistant_response(
     # Add the final openai message
     messages.append({"role": "user", "content": openai_messages[-1]})
 
+    return messages
+
+
+def claude_assistant_response(
+    openai_messages: list[str],
+    claude_messages: list[str],
+    deepseek_messages: list[str] = None,
+    claude_system: str = "",
+) -> str:
+    messages = claude_assistant_messages(
+        openai_messages, claude_messages, deepseek_messages
+    )
     response_claude = get_claude_response(claude_system, messages)
     return response_claude
 
 
-def deepseek_assistant_response(
+def deepseek_assistant_messages(
     openai_messages: list[str],
     claude_messages: list[str],
     deepseek_messages: list[str] = None,
     deepseek_system: str = "",
-) -> str:
+) -> list[dict]:
 
     messages = [{"role": "system", "content": deepseek_system}]
 
@@ -192,10 +420,22 @@ def deepseek_assistant_response(
         openai_messages, claude_messages, deepseek_messages
     ):
         messages.append({"role": "user", "content": f"[OpenAI]: {openai_message}"})
-        messages.append({"role": "user", "content": "[Claude]: {claude_message}"})
+        messages.append({"role": "user", "content": f"[Claude]: {claude_message}"})
         messages.append(
             {"role": "assistant", "content": f"[DeepSeek]: {deepseek_message}"}
         )
 
+    return messages
+
+
+def deepseek_assistant_response(
+    openai_messages: list[str],
+    claude_messages: list[str],
+    deepseek_messages: list[str] = None,
+    deepseek_system: str = "",
+) -> str:
+    messages = deepseek_assistant_messages(
+        openai_messages, claude_messages, deepseek_messages, deepseek_system
+    )
     response_deepseek = get_deepseek_response(messages)
     return response_deepseek
@@ -0,0 +1,639 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+from quantization import ProductQuantizer
+from retrieval import normalize
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Version of the saved layout; indexes saved by another version are rebuilt
+ANN_VERSION = 2
+
+
+class ANNIndex:
+    """
+    Approximate nearest-neighbour index over chunk ids.
+
+    Vectors are added and removed by chunk id, so the index can follow the
+    incremental re-indexing in create_vector_store. Subclasses implement the
+    search structure over integer labels; this class maps labels to chunk
+    ids and doc types, filters results by doc type, and handles persistence.
+    Labels of removed ids are reused by later additions, so the label space
+    stays as large as the most ids ever held at once.
+    """
+
+    kind = None
+
+    def __init__(self, path: str = None, dimensions: int = None) -> None:
+        self.path = path
+        self.dimensions = dimensions
+        self._labels = {}
+        self._ids = []
+        self._doc_types = []
+        self._free = []
+        # Directory this index was last saved to or loaded from
+        self._saved_path = None
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self._labels
+
+    def ids(self) -> list[str]:
+        return list(self._labels)
+
+    def params(self) -> dict:
+        return {}
+
+    def reset(self) -> None:
+        """
+        Drop every vector, keeping the path and build parameters. The
+        dimensions are taken again from the next add.
+        """
+        self.__init__(self.path, **self.params())
+
+    def add(self, ids: list[str], vectors, doc_types: list[str] = None) -> None:
+        """
+        Add or replace the vectors of the given chunk ids.
+        """
+        if not ids:
+            return
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        labels = np.empty(len(ids), dtype=np.int64)
+        for i, id_ in enumerate(ids):
+            doc_type = doc_types[i] if doc_types else ""
+            label = self._labels.get(id_)
+            if label is None:
+                if self._free:
+                    label = self._free.pop()
+                    self._ids[label] = id_
+                else:
+                    label = len(self._ids)
+                    self._ids.append(id_)
+                    self._doc_types.append(doc_type)
+                self._labels[id_] = label
+            self._doc_types[label] = doc_type
+            labels[i] = label
+        self._add(labels, vectors)
+
+    def remove(self, ids: list[str]) -> None:
+        labels = [self._labels.pop(id_) for id_ in ids if id_ in self._labels]
+        for label in labels:
+            self._ids[label] = None
+        self._free.extend(labels)
+        if labels:
+            self._remove(np.asarray(labels, dtype=np.int64))
+
+    def search(self, queries, k: int, doc_types: list[str] = None, overfetch: int = 4) -> list[list[tuple[str, float]]]:
+        """
+        The k nearest chunk ids and cosine similarities for each query.
+        With doc_types, overfetch * k neighbours are searched and filtered.
+        """
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        fetch = min(len(self), k * overfetch if doc_types else k)
+        if fetch == 0:
+            return [[] for _ in queries]
+        labels, scores = self._search(queries, fetch)
+        results = []
+        for query_labels, query_scores in zip(labels, scores):
+            hits = []
+            for label, score in zip(query_labels, query_scores):
+                if label < 0 or self._ids[label] is None:
+                    continue
+                if doc_types and self._doc_types[label] not in doc_types:
+                    continue
+                hits.append((self._ids[label], float(score)))
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results
+
+    def save(self, path: str = None) -> None:
+        """
+        Save the index to a directory, replacing any previous copy.
+        """
+        path = path or self.path
+        self._compact()
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "ann.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": ANN_VERSION,
+                    "kind": self.kind,
+                    "dimensions": self.dimensions,
+                    "params": self.params(),
+                    "ids": self._ids,
+                    "doc_types": self._doc_types,
+                },
+                f,
+            )
+        if self.dimensions is not None:
+            # Files unchanged since the copy at path was written may be linked from it
+            self._save(tmp_path, path if self._saved_path == path and os.path.isdir(path) else None)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        self._saved_path = path
+
+    def _restore(self, data: dict) -> None:
+        self._ids = data["ids"]
+        self._doc_types = data["doc_types"]
+        self._labels = {id_: label for label, id_ in enumerate(self._ids) if id_ is not None}
+        self._free = [label for label, id_ in enumerate(self._ids) if id_ is None]
+
+    def _relabel(self) -> np.ndarray:
+        """
+        Renumber the live labels from 0, dropping removed ones. Returns the
+        new label of every old label, -1 for removed ones.
+        """
+        live = [label for label, id_ in enumerate(self._ids) if id_ is not None]
+        mapping = np.full(len(self._ids), -1, dtype=np.int64)
+        mapping[live] = np.arange(len(live))
+        self._ids = [self._ids[label] for label in live]
+        self._doc_types = [self._doc_types[label] for label in live]
+        self._labels = {id_: label for label, id_ in enumerate(self._ids)}
+        self._free = []
+        return mapping
+
+    def _compact(self) -> None:
+        pass
+
+    def _add(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def _remove(self, labels: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def _search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def _save(self, path: str, previous: str = None) -> None:
+        raise NotImplementedError
+
+
+class IVFIndex(ANNIndex):
+    """
+    Inverted-file index with product-quantized residuals (IVF-PQ) in NumPy.
+
+    Vectors are clustered around n_lists spherical k-means centroids. Each
+    inverted list holds the labels of its vectors and their residuals to
+    the list centroid as n_subvectors one-byte PQ codes (dimensions // 8 by
+    default), so no full vectors are kept: 1M x 1536 vectors take about
+    200 MB instead of 6 GB. A query scans only the n_probe lists with the
+    closest centroids, scoring codes through per-query lookup tables.
+
+    Until enough vectors exist to train (39 per list), they are kept in
+    full and searches are exact. Later inserts are encoded against the
+    trained centroids and codebooks; call train() to re-cluster once the
+    data has drifted. Each list is saved to its own file, and lists that
+    did not change since the last save are hard-linked instead of rewritten.
+    Removed labels are compacted away on save once they make up more than
+    compact_ratio of the label space.
+    """
+
+    kind = "ivf"
+
+    def __init__(
+        self,
+        path: str = None,
+        dimensions: int = None,
+        n_lists: int = 256,
+        n_probe: int = 8,
+        n_subvectors: int = None,
+        train_size: int = 50_000,
+        seed: int = 42,
+        compact_ratio: float = 0.25,
+    ) -> None:
+        super().__init__(path, dimensions)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_subvectors = n_subvectors
+        self.train_size = train_size
+        self.seed = seed
+        self.compact_ratio = compact_ratio
+        # Full vectors by label, only until the index is trained
+        self._untrained = {}
+        self._centroids = None
+        self._quantizer = None
+        # Current list of every label, -1 when it is in none
+        self._list_of = np.zeros(0, dtype=np.int32)
+        self._list_labels = []
+        self._list_codes = []
+        # Entries appended to each list since it was last merged
+        self._appended = []
+        self._dirty = set()
+
+    def params(self) -> dict:
+        return {
+            "n_lists": self.n_lists,
+            "n_probe": self.n_probe,
+            "n_subvectors": self.n_subvectors,
+            "train_size": self.train_size,
+            "seed": self.seed,
+            "compact_ratio": self.compact_ratio,
+        }
+
+    def _subvectors(self) -> int:
+        if self.n_subvectors:
+            return self.n_subvectors
+        # The largest divisor of the dimensions giving slices of at least 8 dimensions
+        return next(n for n in range(max(1, self.dimensions // 8), 0, -1) if self.dimensions % n == 0)
+
+    def _grow(self, size: int) -> None:
+        if size > len(self._list_of):
+            capacity = max(size, 2 * len(self._list_of), 1024)
+            self._list_of = np.concatenate([self._list_of, np.full(capacity - len(self._list_of), -1, dtype=np.int32)])
+
+    def _add(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        if self._centroids is None:
+            self._untrained.update(zip(labels.tolist(), vectors))
+            if len(self._untrained) >= 39 * self.n_lists:
+                self.train()
+            return
+        self._grow(int(labels.max()) + 1)
+        assignment = np.argmax(vectors @ self._centroids.T, axis=1)
+        codes = self._quantizer.encode(vectors - self._centroids[assignment])
+        self._list_of[labels] = assignment
+        for c in np.unique(assignment):
+            in_list = assignment == c
+            self._appended[c].append((labels[in_list], codes[in_list]))
+            self._dirty.add(int(c))
+
+    def _remove(self, labels: np.ndarray) -> None:
+        if self._centroids is None:
+            for label in labels.tolist():
+                self._untrained.pop(label, None)
+            return
+        labels = labels[labels < len(self._list_of)]
+        self._dirty.update(int(c) for c in self._list_of[labels] if c >= 0)
+        self._list_of[labels] = -1
+
+    def _list(self, c: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Labels and codes of list c, merging appended entries and dropping
+        removed, moved and replaced ones.
+        """
+        if self._appended[c]:
+            labels = np.concatenate([self._list_labels[c]] + [labels for labels, _ in self._appended[c]])
+            codes = np.concatenate([self._list_codes[c]] + [codes for _, codes in self._appended[c]])
+            self._appended[c] = []
+            keep = self._list_of[labels] == c
+            labels, codes = labels[keep], codes[keep]
+            # A re-added label keeps only its latest entry
+            _, last = np.unique(labels[::-1], return_index=True)
+            latest = np.sort(len(labels) - 1 - last)
+            self._list_labels[c], self._list_codes[c] = labels[latest], codes[latest]
+        return self._list_labels[c], self._list_codes[c]
+
+    def _vectors(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Labels and (reconstructed, once trained) vectors of every live entry.
+        """
+        if self._centroids is None:
+            labels = np.fromiter(self._untrained, dtype=np.int64, count=len(self._untrained))
+            return labels, np.asarray(list(self._untrained.values()), dtype=np.float32).reshape(len(labels), -1)
+        parts = [(c, *self._list(c)) for c in range(len(self._centroids))]
+        labels = np.concatenate([labels[self._list_of[labels] == c] for c, labels, _ in parts])
+        vectors = np.concatenate(
+            [
+                self._centroids[c] + self._quantizer.decode(codes[self._list_of[labels] == c])
+                for c, labels, codes in parts
+            ]
+        )
+        return labels, vectors
+
+    def train(self, iterations: int = 10) -> None:
+        """
+        Cluster (a sample of) the live vectors, train the PQ codebooks on
+        their residuals and re-encode every vector. A trained index
+        re-trains on its decoded codes.
+        """
+        labels, vectors = self._vectors()
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), self.train_size), replace=False)]
+        n_lists = min(self.n_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # Re-seed empty clusters from random samples
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize(sums)
+
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        residuals = vectors - centroids[assignment]
+        self._quantizer = ProductQuantizer(
+            n_subvectors=self._subvectors(), train_size=self.train_size, seed=self.seed
+        ).fit(residuals)
+        codes = self._quantizer.encode(residuals)
+
+        self._centroids = centroids
+        self._untrained = {}
+        self._list_of = np.full(max(len(self._ids), 1024), -1, dtype=np.int32)
+        self._list_of[labels] = assignment
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self._list_labels = [labels[order[bounds[c]:bounds[c + 1]]] for c in range(n_lists)]
+        self._list_codes = [codes[order[bounds[c]:bounds[c + 1]]] for c in range(n_lists)]
+        self._appended = [[] for _ in range(n_lists)]
+        self._dirty = set(range(n_lists))
+        logger.info(
+            f"Trained IVF-PQ index: {n_lists} lists, {self._quantizer.n_subvectors} byte codes over {len(labels)} vectors"
+        )
+
+    def _search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if self._centroids is None:
+            candidates, vectors = self._vectors()
+            candidate_scores = queries @ vectors.T
+            for i in range(len(queries)):
+                top = np.argpartition(-candidate_scores[i], min(k, len(candidates)) - 1)[:k]
+                top = top[np.argsort(-candidate_scores[i, top])]
+                labels[i, : len(top)] = candidates[top]
+                scores[i, : len(top)] = candidate_scores[i, top]
+            return labels, scores
+
+        centroid_scores = queries @ self._centroids.T
+        n_probe = min(self.n_probe, len(self._centroids))
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        # q . x ~= q . centroid + q . decoded residual, the latter read from the lookup tables
+        tables = self._quantizer.lookup_tables(queries)
+        for i, probe in enumerate(probes):
+            candidates, candidate_scores = [], []
+            for c in probe:
+                list_labels, list_codes = self._list(c)
+                valid = self._list_of[list_labels] == c
+                if not valid.any():
+                    continue
+                candidates.append(list_labels[valid])
+                candidate_scores.append(centroid_scores[i, c] + self._quantizer.scores(tables[i : i + 1], list_codes[valid])[0])
+            if not candidates:
+                continue
+            candidates, candidate_scores = np.concatenate(candidates), np.concatenate(candidate_scores)
+            top = np.argpartition(-candidate_scores, min(k, len(candidates)) - 1)[:k]
+            top = top[np.argsort(-candidate_scores[top])]
+            labels[i, : len(top)] = candidates[top]
+            scores[i, : len(top)] = candidate_scores[top]
+        return labels, scores
+
+    def _compact(self) -> None:
+        if not self._free or len(self._free) <= self.compact_ratio * len(self._ids):
+            return
+        mapping = self._relabel()
+        if self._centroids is None:
+            self._untrained = {int(mapping[label]): vector for label, vector in self._untrained.items()}
+            return
+        list_of = np.full(max(len(self._ids), 1024), -1, dtype=np.int32)
+        for c in range(len(self._centroids)):
+            list_labels, list_codes = self._list(c)
+            valid = self._list_of[list_labels] == c
+            self._list_labels[c] = mapping[list_labels[valid]]
+            self._list_codes[c] = list_codes[valid]
+            list_of[self._list_labels[c]] = c
+        self._list_of = list_of
+        self._dirty = set(range(len(self._centroids)))
+        logger.info(f"Compacted IVF index labels to {len(self._ids)}")
+
+    def _save(self, path: str, previous: str = None) -> None:
+        if self._centroids is None:
+            labels, vectors = self._vectors()
+            np.savez(os.path.join(path, "untrained.npz"), labels=labels, vectors=vectors)
+            return
+        np.save(os.path.join(path, "centroids.npy"), self._centroids)
+        self._quantizer.save(os.path.join(path, "pq_centroids.npy"))
+        os.makedirs(os.path.join(path, "lists"))
+        for c in range(len(self._centroids)):
+            name = os.path.join("lists", f"{c}.npz")
+            if previous is not None and c not in self._dirty and os.path.exists(os.path.join(previous, name)):
+                try:
+                    os.link(os.path.join(previous, name), os.path.join(path, name))
+                    continue
+                except OSError:
+                    pass
+            list_labels, list_codes = self._list(c)
+            valid = self._list_of[list_labels] == c
+            np.savez(os.path.join(path, name), labels=list_labels[valid], codes=list_codes[valid])
+        self._dirty = set()
+
+    def _load(self, path: str) -> None:
+        if os.path.exists(os.path.join(path, "untrained.npz")):
+            data = np.load(os.path.join(path, "untrained.npz"))
+            self._untrained = dict(zip(data["labels"].tolist(), data["vectors"]))
+            return
+        self._centroids = np.load(os.path.join(path, "centroids.npy"))
+        self._quantizer = ProductQuantizer.load(os.path.join(path, "pq_centroids.npy"))
+        self._list_of = np.full(max(len(self._ids), 1024), -1, dtype=np.int32)
+        self._list_labels, self._list_codes = [], []
+        for c in range(len(self._centroids)):
+            data = np.load(os.path.join(path, "lists", f"{c}.npz"))
+            self._list_labels.append(data["labels"])
+            self._list_codes.append(data["codes"])
+            self._list_of[data["labels"]] = c
+        self._appended = [[] for _ in range(len(self._centroids))]
+
+
+class HNSWIndex(ANNIndex):
+    """
+    Hierarchical navigable small world graph, backed by hnswlib.
+
+    m and ef_construction trade build time and memory for graph quality;
+    ef_search trades query latency for recall. The graph grows as vectors
+    are added; removed ids are marked deleted, and their labels are updated
+    in place when reused.
+    """
+
+    kind = "hnsw"
+
+    def __init__(
+        self,
+        path: str = None,
+        dimensions: int = None,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        initial_capacity: int = 10_000,
+    ) -> None:
+        if hnswlib is None:
+            raise ImportError("HNSWIndex requires hnswlib: pip install hnswlib")
+        super().__init__(path, dimensions)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.initial_capacity = initial_capacity
+        self._index = None
+
+    def params(self) -> dict:
+        return {
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "initial_capacity": self.initial_capacity,
+        }
+
+    def _create(self, capacity: int) -> None:
+        self._index = hnswlib.Index(space="cosine", dim=self.dimensions)
+        self._index.init_index(max_elements=capacity, ef_construction=self.ef_construction, M=self.m)
+
+    def _add(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        if self._index is None:
+            self._create(max(self.initial_capacity, len(labels)))
+        capacity = self._index.get_max_elements()
+        needed = int(labels.max()) + 1
+        if needed > capacity:
+            self._index.resize_index(max(needed, 2 * capacity))
+        self._index.add_items(vectors, labels)
+
+    def _remove(self, labels: np.ndarray) -> None:
+        for label in labels:
+            self._index.mark_deleted(int(label))
+
+    def _search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        self._index.set_ef(max(self.ef_search, k))
+        labels, distances = self._index.knn_query(queries, k=k)
+        return labels.astype(np.int64), 1 - distances
+
+    def _save(self, path: str, previous: str = None) -> None:
+        self._index.save_index(os.path.join(path, "hnsw.bin"))
+
+    def _load(self, path: str) -> None:
+        self._index = hnswlib.Index(space="cosine", dim=self.dimensions)
+        self._index.load_index(os.path.join(path, "hnsw.bin"), max_elements=max(self.initial_capacity, len(self._ids)))
+
+
+INDEX_TYPES = {"ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+def create_ann_index(kind: str = "auto", path: str = None, **params) -> ANNIndex:
+    """
+    Create an empty index: "hnsw", "ivf", or "auto" for HNSW when hnswlib is
+    installed and IVF otherwise.
+    """
+    if kind == "auto":
+        kind = "hnsw" if hnswlib is not None else "ivf"
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index kind {kind}, expected one of {list(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](path=path, **params)
+
+
+def load_ann_index(path: str) -> ANNIndex:
+    with open(os.path.join(path, "ann.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != ANN_VERSION:
+        # create_vector_store back-fills an empty index from the stored embeddings
+        logger.warning(f"ANN index at {path} has an old layout, starting an empty one")
+        return create_ann_index(data["kind"], path=path)
+    index = INDEX_TYPES[data["kind"]](path=path, dimensions=data["dimensions"], **data["params"])
+    index._restore(data)
+    if data["dimensions"] is not None:
+        index._load(path)
+    index._saved_path = path
+    return index
+
+
+def open_ann_index(path: str, kind: str = "auto", **params) -> ANNIndex:
+    """
+    Load the index saved at path, or create an empty one to be saved there.
+    """
+    if os.path.exists(os.path.join(path, "ann.json")):
+        return load_ann_index(path)
+    return create_ann_index(kind, path=path, **params)
+
+
+def synthetic_vectors(n: int, dimensions: int, n_clusters: int = 100, spread: float = 0.5, seed: int = 42) -> np.ndarray:
+    """
+    Normalized Gaussian clusters, a rough stand-in for text embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, size=n)] + spread * rng.normal(size=(n, dimensions)).astype(np.float32)
+    return normalize(vectors)
+
+
+def benchmark(vectors: np.ndarray, n_queries: int = 200, k: int = 10, configs: list[tuple] = None, seed: int = 42) -> list[dict]:
+    """
+    Report build time, and recall@k and latency for each search setting,
+    against brute-force ground truth. Queries are held-out vectors.
+
+    configs is a list of (kind, build params, search attribute, values),
+    e.g. ("ivf", {"n_lists": 1024}, "n_probe", [1, 4, 16, 64]).
+    """
+    if configs is None:
+        configs = [("ivf", {"n_lists": max(1, int(np.sqrt(len(vectors))))}, "n_probe", [1, 4, 16, 64])]
+        if hnswlib is not None:
+            configs.append(("hnsw", {"m": 16, "ef_construction": 200}, "ef_search", [16, 32, 64, 128, 256]))
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    queries, base = normalize(vectors[order[:n_queries]]), vectors[order[n_queries:]]
+    ids = [str(i) for i in range(len(base))]
+    base = normalize(base)
+
+    start = time.perf_counter()
+    ground_truth = []
+    for block in range(0, n_queries, 64):
+        scores = queries[block:block + 64] @ base.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ground_truth.extend({str(i) for i in row} for row in top)
+    brute_force_time = (time.perf_counter() - start) / n_queries
+    print(f"{len(base)} vectors x {base.shape[1]} dims, brute force {brute_force_time * 1000:.2f} ms/query")
+
+    results = []
+    for kind, build_params, attribute, values in configs:
+        index = create_ann_index(kind, **build_params)
+        start = time.perf_counter()
+        for block in range(0, len(base), 10_000):
+            index.add(ids[block:block + 10_000], base[block:block + 10_000])
+        build_time = time.perf_counter() - start
+        for value in values:
+            setattr(index, attribute, value)
+            latencies = []
+            recall = 0.0
+            for query, truth in zip(queries, ground_truth):
+                query_start = time.perf_counter()
+                hits = index.search(query, k)[0]
+                latencies.append(time.perf_counter() - query_start)
+                recall += len(truth & {id_ for id_, _ in hits}) / k
+            result = {
+                "kind": kind,
+                **build_params,
+                attribute: value,
+                "build_seconds": build_time,
+                f"recall@{k}": recall / n_queries,
+                "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+                "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+            }
+            results.append(result)
+            print(
+                f"{kind:>5} {attribute}={value:<4} build {build_time:6.1f}s  recall@{k} {result[f'recall@{k}']:.3f}  "
+                f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("Synthetic embeddings")
+    benchmark(synthetic_vectors(100_000, 256))
+
+    # Real embeddings from the flat export of the vector store, if present
+    if os.path.exists(os.path.join("vector_db_flat_float32", "vectors.npy")):
+        print("\nvector_db embeddings")
+        vectors = np.load(os.path.join("vector_db_flat_float32", "vectors.npy"), mmap_mode="r")
+        benchmark(np.asarray(vectors, dtype=np.float32), n_queries=min(200, len(vectors) // 5))
@@ -0,0 +1,289 @@
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import time
+from collections import Counter, deque
+
+import numpy as np
+from langchain.schema import Document
+from retrieval import mmr
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how i in is it its me of on or our "
+    "that the their there this to was we what when where which who whom why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+def build_bm25_index(vectorstore, path: str, page_size: int = 1000, fingerprint: str = None) -> None:
+    """
+    Build a BM25 inverted index over the chunks stored in a Chroma collection
+    (the CharacterTextSplitter chunks) and save it to a directory.
+
+    Postings are stored as flat arrays: the rows and term frequencies of
+    every term are contiguous, located through a per-term offset. Chunk
+    texts go to a JSON lines sidecar so lexical hits can be returned without
+    touching the vector store. fingerprint identifies the collection's
+    content and is stored in the header, as for the flat index.
+    """
+    collection = vectorstore._collection
+    if collection.count() == 0:
+        raise ValueError("Cannot index an empty collection")
+    postings = {}
+    lengths = []
+    codes = []
+    doc_types = {}
+    offsets = [0]
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    with open(os.path.join(tmp_path, "records.jsonl"), "wb") as records:
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=len(lengths))
+            if not page["ids"]:
+                break
+            for id_, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                row = len(lengths)
+                counts = Counter(tokenize(document))
+                for term, tf in counts.items():
+                    postings.setdefault(term, []).append((row, tf))
+                lengths.append(sum(counts.values()))
+                codes.append(doc_types.setdefault((metadata or {}).get("doc_type", ""), len(doc_types)))
+                line = json.dumps({"id": id_, "document": document, "metadata": metadata}, ensure_ascii=False)
+                records.write(line.encode("utf-8") + b"\n")
+                offsets.append(records.tell())
+
+    terms = sorted(postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    rows = np.fromiter((row for term in terms for row, _ in postings[term]), dtype=np.int32, count=int(term_offsets[-1]))
+    tfs = np.fromiter((min(tf, 65535) for term in terms for _, tf in postings[term]), dtype=np.uint16, count=int(term_offsets[-1]))
+
+    np.savez(
+        os.path.join(tmp_path, "postings.npz"),
+        term_offsets=term_offsets,
+        rows=rows,
+        tfs=tfs,
+        lengths=np.asarray(lengths, dtype=np.int32),
+        doc_types=np.asarray(codes, dtype=np.int16),
+        record_offsets=np.asarray(offsets, dtype=np.int64),
+    )
+    with open(os.path.join(tmp_path, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": 1,
+                "count": len(lengths),
+                "terms": terms,
+                "doc_types": list(doc_types),
+                "fingerprint": fingerprint,
+            },
+            f,
+        )
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Built BM25 index: {len(lengths)} chunks, {len(terms)} terms, {len(rows)} postings")
+
+
+class BM25Index:
+    """
+    Okapi BM25 search over an index written by build_bm25_index.
+
+    A query only reads the postings of its own terms; scores are summed
+    with NumPy over those postings, never over the whole corpus.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.terms = {term: i for i, term in enumerate(self.header["terms"])}
+        data = np.load(os.path.join(path, "postings.npz"))
+        self.term_offsets = data["term_offsets"]
+        self.rows = data["rows"]
+        self.tfs = data["tfs"].astype(np.float32)
+        self.lengths = data["lengths"]
+        self.codes = data["doc_types"]
+        self.record_offsets = data["record_offsets"]
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        # Length normalization of each chunk, computed once
+        self._norms = (self.k1 * (1 - self.b + self.b * self.lengths / max(self.average_length, 1.0))).astype(np.float32)
+        self._records_file = open(os.path.join(path, "records.jsonl"), "rb")
+        self._records = mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def document_frequency(self, term: str) -> int:
+        i = self.terms.get(term)
+        return 0 if i is None else int(self.term_offsets[i + 1] - self.term_offsets[i])
+
+    def idf(self, term: str) -> float:
+        df = self.document_frequency(term)
+        return math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int, doc_types: list[str] = None) -> list[tuple[int, float]]:
+        """
+        The k best (row, score) pairs for the query, best first.
+        """
+        all_rows, all_scores = [], []
+        for term in set(tokenize(query)):
+            i = self.terms.get(term)
+            if i is None:
+                continue
+            start, end = self.term_offsets[i], self.term_offsets[i + 1]
+            rows, tfs = self.rows[start:end], self.tfs[start:end]
+            all_rows.append(rows)
+            all_scores.append(self.idf(term) * tfs * (self.k1 + 1) / (tfs + self._norms[rows]))
+        if not all_rows:
+            return []
+
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if doc_types:
+            wanted = [self.header["doc_types"].index(t) for t in doc_types if t in self.header["doc_types"]]
+            keep = np.isin(self.codes[rows], wanted)
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def record(self, row: int) -> dict:
+        return json.loads(self._records[self.record_offsets[row]:self.record_offsets[row + 1]])
+
+    def document(self, row: int) -> Document:
+        record = self.record(row)
+        return Document(page_content=record["document"], metadata={**(record["metadata"] or {}), "id": record["id"]})
+
+    def close(self) -> None:
+        self._records.close()
+        self._records_file.close()
+
+
+class HybridRetriever:
+    """
+    Lexical and vector retrieval fused with reciprocal rank fusion.
+
+    Queries whose rare terms (names of parties, products, employees) all
+    occur in the best lexical hit are answered from BM25 alone, without
+    embedding the query. Other queries fetch fetch_k candidates from BM25
+    and from the retriever's index, fuse the two rankings as
+    sum(1 / (rrf_k + rank)), and pick the final k from the fetch_k best
+    fused candidates with the retriever's MMR.
+
+    Exposes the same retrieve() and timings as Retriever, so it can be
+    dropped into chat; timings keep the last max_timings queries.
+    """
+
+    def __init__(
+        self,
+        bm25: BM25Index,
+        retriever,
+        k: int = 4,
+        fetch_k: int = 20,
+        rrf_k: int = 60,
+        rare_df_ratio: float = 0.02,
+        min_rare_df: int = 5,
+        max_timings: int = 10_000,
+    ) -> None:
+        self.bm25 = bm25
+        self.retriever = retriever
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.rare_df_ratio = rare_df_ratio
+        self.min_rare_df = min_rare_df
+        self.timings = deque(maxlen=max_timings)
+
+    def _rare_terms(self, query: str) -> set[str]:
+        # A name split across a few chunks of one document still counts as rare
+        max_df = max(self.min_rare_df, int(self.rare_df_ratio * len(self.bm25)))
+        return {term for term in tokenize(query) if 0 < self.bm25.document_frequency(term) <= max_df}
+
+    def retrieve(self, query: str, doc_types: list[str] = None, k: int = None) -> list[Document]:
+        k = k or self.k
+        start = time.perf_counter()
+        lexical = self.bm25.search(query, max(self.fetch_k, k), doc_types)
+        lexical_time = time.perf_counter() - start
+
+        rare_terms = self._rare_terms(query)
+        if lexical and rare_terms and rare_terms <= set(tokenize(self.bm25.record(lexical[0][0])["document"])):
+            documents = [self.bm25.document(row) for row, _ in lexical[:k]]
+            self.timings.append(
+                {
+                    "lexical": lexical_time,
+                    "dense": 0.0,
+                    "rerank": 0.0,
+                    "total": time.perf_counter() - start,
+                    "short_circuit": True,
+                }
+            )
+            return documents
+
+        # Raw dense candidates, before the retriever's own MMR, so fusion sees the full ranking
+        dense_start = time.perf_counter()
+        query_vector = np.asarray(self.retriever.embeddings.embed_query(query), dtype=np.float32)
+        dense = self.retriever.index.candidates(query_vector, max(self.fetch_k, k), doc_types)
+        dense_time = time.perf_counter() - dense_start
+
+        rerank_start = time.perf_counter()
+        fused = {}
+        documents = {}
+        vectors = {}
+        for rank, (row, _) in enumerate(lexical):
+            document = self.bm25.document(row)
+            id_ = document.metadata["id"]
+            documents[id_] = document
+            fused[id_] = fused.get(id_, 0.0) + 1 / (self.rrf_k + rank + 1)
+        for rank, id_ in enumerate(dense["ids"]):
+            documents.setdefault(
+                id_, Document(page_content=dense["documents"][rank], metadata={**(dense["metadatas"][rank] or {}), "id": id_})
+            )
+            vectors[id_] = dense["embeddings"][rank]
+            fused[id_] = fused.get(id_, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        ranked = sorted(fused, key=lambda id_: -fused[id_])[: max(self.fetch_k, k)]
+        if not ranked:
+            return []
+        missing = [id_ for id_ in ranked if id_ not in vectors]
+        if missing:
+            # Lexical-only hits have no vector yet
+            vectors.update(zip(missing, self.retriever.index.vectors(missing)))
+        order = mmr(query_vector, np.stack([vectors[id_] for id_ in ranked]), k, self.retriever.lambda_mult)
+        self.timings.append(
+            {
+                "lexical": lexical_time,
+                "dense": dense_time,
+                "rerank": time.perf_counter() - rerank_start,
+                "total": time.perf_counter() - start,
+                "short_circuit": False,
+            }
+        )
+        return [documents[ranked[i]] for i in order]
+
+    def latency_stats(self) -> dict:
+        """
+        Share of short-circuited queries and p50/p95/p99 of each stage, in seconds.
+        """
+        stats = {
+            "queries": len(self.timings),
+            "short_circuit_rate": sum(t["short_circuit"] for t in self.timings) / len(self.timings) if self.timings else 0.0,
+        }
+        for stage in ("lexical", "dense", "rerank", "total"):
+            values = [timing[stage] for timing in self.timings]
+            for p in (50, 95, 99):
+                stats[f"p{p}_{stage}"] = float(np.percentile(values, p)) if values else 0.0
+        return stats
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with a persistent SQLite cache.
+
+    Vectors are stored as float32 blobs keyed by (model name, text hash).
+    When the cache grows past max_entries the least recently used vectors
+    are evicted.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str = "embedding_cache.db",
+        max_entries: int = 500_000,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        if getattr(embeddings, "dimensions", None):
+            # Reduced-dimension vectors must not be served for full-size requests
+            self.model = f"{self.model}@{embeddings.dimensions}"
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _lookup(self, texts: list[str]) -> tuple[list, list[int]]:
+        """
+        Return cached vectors (None for misses) and the indices of the misses.
+        """
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+        vectors = []
+        missing = []
+        for i, key in enumerate(keys):
+            if key in found:
+                vectors.append(np.frombuffer(found[key], dtype=np.float32).tolist())
+            else:
+                vectors.append(None)
+                missing.append(i)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def _store(self, texts: list[str], vectors: list[list[float]]) -> None:
+        now = time.time()
+        rows = [
+            (self._key(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """
+        Drop the least recently used entries beyond max_entries.
+        """
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            logger.info(f"Evicted {excess} entries from the embedding cache")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, missing = self._lookup(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_vectors = self.embeddings.embed_documents(missing_texts)
+            self._store(missing_texts, new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        vectors, missing = self._lookup([text])
+        if missing:
+            vectors[0] = self.embeddings.embed_query(text)
+            self._store([text], vectors)
+        return vectors[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, missing = self._lookup(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_vectors = await self.embeddings.aembed_documents(missing_texts)
+            self._store(missing_texts, new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+        return vectors
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vectors, missing = self._lookup([text])
+        if missing:
+            vectors[0] = await self.embeddings.aembed_query(text)
+            self._store([text], vectors)
+        return vectors[0]
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters and current size of the cache.
+        """
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
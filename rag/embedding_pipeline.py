@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from langchain.schema import Document
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def token_batches(
+    chunks: dict[str, Document],
+    max_batch_tokens: int = 50_000,
+    max_batch_size: int = 512,
+) -> list[list[str]]:
+    """
+    Pack chunk ids into batches that stay under a token and item budget.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for id_, chunk in chunks.items():
+        tokens = count_tokens(chunk.page_content)
+        if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(id_)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Check whether an error from the embeddings client is a 429 rate limit.
+    """
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+async def embed_with_retry(
+    embeddings: Embeddings,
+    texts: list[str],
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+) -> list[list[float]]:
+    """
+    Embed a batch, retrying rate-limited requests with full-jitter exponential backoff.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await embeddings.aembed_documents(texts)
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            logger.warning(f"Rate limited, retrying batch of {len(texts)} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def run_embedding_pipeline(
+    chunks: dict[str, Document],
+    embeddings: Embeddings,
+    vectorstore: Chroma,
+    max_in_flight: int = 4,
+    max_batch_tokens: int = 50_000,
+    max_batch_size: int = 512,
+    ann_index=None,
+) -> dict:
+    """
+    Embed chunks (keyed by id) in concurrent token-budgeted batches and
+    upsert each batch into the vector store, and into ann_index if given,
+    as soon as it completes.
+
+    Any Embeddings implementation works, so the pipeline can be pointed at a
+    local fake server with e.g. OpenAIEmbeddings(base_url="http://localhost:8000/v1").
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def embed_batch(ids: list[str]) -> tuple[list[str], list[list[float]], float]:
+        async with semaphore:
+            start = time.perf_counter()
+            vectors = await embed_with_retry(embeddings, [chunks[id_].page_content for id_ in ids])
+            return ids, vectors, time.perf_counter() - start
+
+    batches = token_batches(chunks, max_batch_tokens, max_batch_size)
+    start = time.perf_counter()
+    latencies = []
+    tasks = [asyncio.create_task(embed_batch(ids)) for ids in batches]
+    try:
+        for task in asyncio.as_completed(tasks):
+            ids, vectors, latency = await task
+            latencies.append(latency)
+            await asyncio.to_thread(
+                vectorstore._collection.upsert,
+                ids=ids,
+                embeddings=vectors,
+                documents=[chunks[id_].page_content for id_ in ids],
+                metadatas=[chunks[id_].metadata for id_ in ids],
+            )
+            if ann_index is not None:
+                ann_index.add(ids, vectors, [chunks[id_].metadata.get("doc_type", "") for id_ in ids])
+    finally:
+        for task in tasks:
+            task.cancel()
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "chunks": len(chunks),
+        "batches": len(batches),
+        "seconds": elapsed,
+        "chunks_per_sec": len(chunks) / elapsed if elapsed else 0.0,
+        "p50_batch_latency": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_batch_latency": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        "p99_batch_latency": float(np.percentile(latencies, 99)) if latencies else 0.0,
+    }
+    logger.info(
+        f"Embedded {stats['chunks']} chunks in {stats['batches']} batches over {elapsed:.2f}s "
+        f"({stats['chunks_per_sec']:.1f} chunks/sec); batch latency "
+        f"p50={stats['p50_batch_latency']:.2f}s p95={stats['p95_batch_latency']:.2f}s "
+        f"p99={stats['p99_batch_latency']:.2f}s"
+    )
+    return stats
@@ -0,0 +1,425 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from quantization import ProductQuantizer, memory_bytes, quantize_int8, truncate_dimensions
+from retrieval import normalize
+
+logger = logging.getLogger(__name__)
+
+DTYPES = ("float32", "float16", "int8", "pq")
+
+
+def export_flat_index(
+        vectorstore,
+        path: str,
+        dtype: str = "float32",
+        page_size: int = 1000,
+        dimensions: int = None,
+        pq_subvectors: int = None,
+        fingerprint: str = None,
+    ) -> None:
+    """
+    Export a Chroma collection to a flat index directory.
+
+    The directory holds the row-normalized vectors as an .npy matrix, the
+    doc type of each row as a small integer code, and a JSON lines sidecar
+    of ids, documents and metadatas with a byte offset per row. Rows are
+    written page by page into a memory-mapped file, so the collection is
+    never loaded at once. The new index is written next to the old one and
+    swapped in when complete.
+
+    dtype float16, int8 (with a per-row scale) or pq (product quantization
+    with pq_subvectors one-byte codes per row, dimensions // 8 by default)
+    shrinks the searched matrix. Those exports also keep the float32 vectors
+    in full.npy, which is only read to rescore the top candidates. With
+    dimensions, vectors are cut to their leading dimensions and
+    re-normalized, as for text-embedding-3 models.
+
+    fingerprint identifies the collection's content and is stored in the
+    header for is_stale.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype}")
+    collection = vectorstore._collection
+    count = collection.count()
+    if count == 0:
+        raise ValueError("Cannot export an empty collection")
+    stored_dimensions = len(collection.get(limit=1, include=["embeddings"])["embeddings"][0])
+    dimensions = min(dimensions or stored_dimensions, stored_dimensions)
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    full_name = "vectors.npy" if dtype == "float32" else "full.npy"
+    full = np.lib.format.open_memmap(os.path.join(tmp_path, full_name), mode="w+", dtype=np.float32, shape=(count, dimensions))
+    codes = np.zeros(count, dtype=np.int16)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    doc_types = {}
+
+    row = 0
+    with open(os.path.join(tmp_path, "records.jsonl"), "wb") as records:
+        while row < count:
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=row)
+            if not page["ids"]:
+                break
+            block = normalize(np.asarray(page["embeddings"], dtype=np.float32))
+            if dimensions < stored_dimensions:
+                block = truncate_dimensions(block, dimensions)
+            end = row + len(block)
+            full[row:end] = block
+            for i, (id_, document, metadata) in enumerate(zip(page["ids"], page["documents"], page["metadatas"])):
+                doc_type = (metadata or {}).get("doc_type", "")
+                codes[row + i] = doc_types.setdefault(doc_type, len(doc_types))
+                offsets[row + i] = records.tell()
+                line = json.dumps({"id": id_, "document": document, "metadata": metadata}, ensure_ascii=False)
+                records.write(line.encode("utf-8") + b"\n")
+            row = end
+        offsets[row] = records.tell()
+    full.flush()
+
+    scales = np.ones(row, dtype=np.float32)
+    if dtype != "float32":
+        if dtype == "pq":
+            pq_subvectors = pq_subvectors or dimensions // 8
+            quantizer = ProductQuantizer(n_subvectors=pq_subvectors).fit(full[:row])
+            quantizer.save(os.path.join(tmp_path, "pq_centroids.npy"))
+            shape, stored_dtype = (row, pq_subvectors), np.uint8
+        else:
+            shape, stored_dtype = (row, dimensions), dtype
+        vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+", dtype=stored_dtype, shape=shape)
+        for start in range(0, row, page_size * 10):
+            end = min(start + page_size * 10, row)
+            block = np.asarray(full[start:end])
+            if dtype == "int8":
+                vectors[start:end], scales[start:end] = quantize_int8(block)
+            elif dtype == "pq":
+                vectors[start:end] = quantizer.encode(block)
+            else:
+                vectors[start:end] = block.astype(dtype)
+        vectors.flush()
+        del vectors
+    del full
+
+    np.save(os.path.join(tmp_path, "scales.npy"), scales)
+    np.save(os.path.join(tmp_path, "doc_types.npy"), codes[:row])
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets[: row + 1])
+    with open(os.path.join(tmp_path, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": 1,
+                "dtype": dtype,
+                "count": row,
+                "dimensions": dimensions,
+                "doc_types": list(doc_types),
+                "fingerprint": fingerprint,
+            },
+            f,
+        )
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Exported {row} vectors ({dtype}, {dimensions} dims) to {path}")
+
+
+class FlatIndex:
+    """
+    Exact search over a memory-mapped flat index written by export_flat_index.
+
+    All arrays are opened with mmap_mode="r", so every process that opens the
+    same index shares the operating system's page cache instead of holding
+    its own copy. Queries are scored in blocks with one matrix product per
+    block and the top k are kept with argpartition.
+
+    Quantized indexes fetch rescore * k candidates and re-rank them against
+    the full-precision vectors; rescore=0 returns the quantized ranking.
+    """
+
+    def __init__(self, path: str, block_size: int = 65_536, rescore: int = 4) -> None:
+        self.path = path
+        self.block_size = block_size
+        self.rescore = rescore
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.codes = np.load(os.path.join(path, "doc_types.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        full_path = os.path.join(path, "full.npy")
+        self.full = np.load(full_path, mmap_mode="r") if os.path.exists(full_path) else None
+        self.quantizer = ProductQuantizer.load(os.path.join(path, "pq_centroids.npy")) if self.header["dtype"] == "pq" else None
+        self._records_file = open(os.path.join(path, "records.jsonl"), "rb")
+        self._records = mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._rows = None
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def _mask(self, doc_types: list[str] = None) -> np.ndarray:
+        if not doc_types:
+            return None
+        wanted = [self.header["doc_types"].index(t) for t in doc_types if t in self.header["doc_types"]]
+        return np.isin(self.codes, wanted)
+
+    def search(self, queries: np.ndarray, k: int, doc_types: list[str] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k rows by cosine similarity for a batch of queries. Returns
+        (rows, scores), each of shape (n_queries, k), best first; rows are -1
+        where fewer than k rows match.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if queries.shape[1] > self.header["dimensions"]:
+            queries = truncate_dimensions(queries, self.header["dimensions"])
+        queries = normalize(queries)
+        rescore = self.full is not None and self.rescore > 1
+        fetch = k * self.rescore if rescore else k
+        tables = self.quantizer.lookup_tables(queries) if self.quantizer is not None else None
+        mask = self._mask(doc_types)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+
+        for start in range(0, len(self), self.block_size):
+            end = min(start + self.block_size, len(self))
+            block = self.vectors[start:end]
+            if tables is not None:
+                scores = self.quantizer.scores(tables, np.asarray(block))
+            else:
+                scores = queries @ (block if block.dtype == np.float32 else block.astype(np.float32)).T
+            if self.header["dtype"] == "int8":
+                scores *= self.scales[start:end]
+            if mask is not None:
+                scores[:, ~mask[start:end]] = -np.inf
+
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > fetch:
+                top = np.argpartition(-scores, fetch - 1, axis=1)[:, :fetch]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        if rescore:
+            # Exact scores for the candidates, from the full-precision vectors
+            valid = np.isfinite(best_scores)
+            vectors = np.asarray(self.full[np.where(valid, best_rows, 0).ravel()]).reshape(*best_rows.shape, -1)
+            best_scores = np.where(valid, np.einsum("qcd,qd->qc", vectors, queries), -np.inf).astype(np.float32)
+
+        order = np.argsort(-best_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.where(np.isfinite(best_scores), np.take_along_axis(best_rows, order, axis=1), -1)
+        return best_rows, best_scores
+
+    def record(self, row: int) -> dict:
+        """
+        The id, document and metadata of a row, read from the mapped sidecar.
+        """
+        return json.loads(self._records[self.offsets[row]:self.offsets[row + 1]])
+
+    def vector(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Vectors of the given rows as float32, at full precision when kept.
+        """
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        if self.quantizer is not None:
+            return self.quantizer.decode(np.asarray(self.vectors[rows]))
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.header["dtype"] == "int8":
+            vectors *= np.asarray(self.scales[rows])[:, None]
+        return vectors
+
+    def vectors(self, ids: list[str]) -> np.ndarray:
+        """
+        Vectors of the given ids, in the order of ids. The id to row map is
+        read from the sidecar on first use.
+        """
+        if self._rows is None:
+            self._rows = {self.record(row)["id"]: row for row in range(len(self))}
+        return self.vector(np.asarray([self._rows[id_] for id_ in ids], dtype=np.int64))
+
+    def candidates(self, query_vector: np.ndarray, fetch_k: int, doc_types: list[str] = None) -> dict:
+        """
+        Candidate search for a Retriever.
+        """
+        rows, _ = self.search(query_vector, fetch_k, doc_types)
+        rows = rows[0][rows[0] >= 0]
+        records = [self.record(row) for row in rows]
+        return {
+            "ids": [record["id"] for record in records],
+            "documents": [record["document"] for record in records],
+            "metadatas": [record["metadata"] for record in records],
+            "embeddings": self.vector(rows),
+        }
+
+    def close(self) -> None:
+        self._records.close()
+        self._records_file.close()
+
+
+def is_stale(path: str, fingerprint: str) -> bool:
+    """
+    Whether the index at path is missing or was built from other content
+    than the collection fingerprint describes.
+    """
+    header = os.path.join(path, "header.json")
+    if not os.path.exists(header):
+        return True
+    with open(header, "r", encoding="utf-8") as f:
+        return json.load(f).get("fingerprint") != fingerprint
+
+
+_worker_index = None
+
+
+def _open_worker_index(path: str) -> None:
+    global _worker_index
+    _worker_index = FlatIndex(path)
+
+
+def _worker_search(args: tuple) -> float:
+    queries, k = args
+    start = time.perf_counter()
+    _worker_index.search(queries, k)
+    return time.perf_counter() - start
+
+
+def _report(name: str, latencies: list[float], n_queries: int, elapsed: float) -> None:
+    print(
+        f"{name:>24}: {n_queries / elapsed:8.1f} QPS, "
+        f"p50 {np.percentile(latencies, 50) * 1000:.2f} ms, p99 {np.percentile(latencies, 99) * 1000:.2f} ms"
+    )
+
+
+def benchmark(vectorstore, path: str, n_queries: int = 500, k: int = 4, batch_size: int = 32, workers: int = 4, seed: int = 42) -> None:
+    """
+    Compare Chroma against the flat index on the same vectors. Queries are
+    stored vectors with noise added. The flat index is measured one query at
+    a time, in batches, and from a pool of processes sharing the mapped file.
+    """
+    index = FlatIndex(path)
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(index), size=n_queries)
+    queries = index.vector(rows) + rng.normal(0, 0.01, size=(n_queries, index.header["dimensions"])).astype(np.float32)
+
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        vectorstore._collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append(time.perf_counter() - query_start)
+    _report("chroma", latencies, n_queries, time.perf_counter() - start)
+
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        query_start = time.perf_counter()
+        index.search(query, k)
+        latencies.append(time.perf_counter() - query_start)
+    _report(f"flat {index.header['dtype']}", latencies, n_queries, time.perf_counter() - start)
+
+    batches = [queries[i:i + batch_size] for i in range(0, n_queries, batch_size)]
+    latencies = []
+    start = time.perf_counter()
+    for batch in batches:
+        batch_start = time.perf_counter()
+        index.search(batch, k)
+        latencies.append(time.perf_counter() - batch_start)
+    _report(f"flat batch {batch_size} (per batch)", latencies, n_queries, time.perf_counter() - start)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_index, initargs=(path,)) as executor:
+        # Warm up the workers so start-up is not timed
+        list(executor.map(_worker_search, [(queries[:1], k)] * workers))
+        start = time.perf_counter()
+        latencies = list(executor.map(_worker_search, [(batch, k) for batch in batches]))
+        _report(f"{workers} processes (per batch)", latencies, n_queries, time.perf_counter() - start)
+    index.close()
+
+
+def quantization_report(
+        vectorstore,
+        base_path: str = "vector_db_flat",
+        configs: list[tuple] = None,
+        n_queries: int = 200,
+        k: int = 10,
+        seed: int = 42,
+    ) -> list[dict]:
+    """
+    Export the collection in each (dtype, dimensions, rescore) configuration
+    and report searched memory, query latency, and recall@k against exact
+    float32 search over the full dimensions. Queries are stored vectors
+    with noise added.
+    """
+    if configs is None:
+        configs = [
+            ("float32", None, 0),
+            ("float16", None, 0),
+            ("int8", None, 0),
+            ("int8", None, 4),
+            ("pq", None, 0),
+            ("pq", None, 10),
+            ("float32", 512, 0),
+            ("int8", 512, 4),
+        ]
+    exported = {}
+
+    def index_path(dtype: str, dimensions: int) -> str:
+        path = f"{base_path}_{dtype}" + (f"_{dimensions}" if dimensions else "")
+        if path not in exported:
+            export_flat_index(vectorstore, path, dtype=dtype, dimensions=dimensions)
+            exported[path] = True
+        return path
+
+    exact = FlatIndex(index_path("float32", None))
+    rng = np.random.default_rng(seed)
+    queries = exact.vector(rng.integers(0, len(exact), size=n_queries))
+    queries += rng.normal(0, 0.01, size=queries.shape).astype(np.float32)
+    ground_truth = [set(row) for row in exact.search(queries, k)[0].tolist()]
+    baseline = memory_bytes(exact.path)
+    exact.close()
+
+    results = []
+    for dtype, dimensions, rescore in configs:
+        index = FlatIndex(index_path(dtype, dimensions), rescore=rescore)
+        latencies = []
+        recall = 0.0
+        for query, truth in zip(queries, ground_truth):
+            start = time.perf_counter()
+            rows = index.search(query, k)[0][0]
+            latencies.append(time.perf_counter() - start)
+            recall += len(truth & set(rows.tolist())) / k
+        result = {
+            "dtype": dtype,
+            "dimensions": index.header["dimensions"],
+            "rescore": rescore,
+            "memory_mb": memory_bytes(index.path) / 1e6,
+            "compression": baseline / memory_bytes(index.path),
+            f"recall@{k}": recall / n_queries,
+            "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+            "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        }
+        results.append(result)
+        print(
+            f"{dtype:>7} {result['dimensions']:>5} dims rescore {rescore:>2}: {result['memory_mb']:8.2f} MB "
+            f"({result['compression']:4.1f}x)  recall@{k} {result[f'recall@{k}']:.3f}  "
+            f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms"
+        )
+        index.close()
+    return results
+
+
+if __name__ == "__main__":
+    from langchain_chroma import Chroma
+
+    logging.basicConfig(level=logging.INFO)
+    vectorstore = Chroma(persist_directory="vector_db")
+    for dtype in DTYPES:
+        path = f"vector_db_flat_{dtype}"
+        export_flat_index(vectorstore, path, dtype=dtype)
+        benchmark(vectorstore, path)
+    quantization_report(vectorstore)
@@ -0,0 +1,128 @@
+import random
+import string
+import time
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over the keys of a context dict.
+
+    The automaton is built once, then each message is scanned in a single
+    pass whose cost does not depend on the number of keys. Keys can have
+    aliases (e.g. an employee's full name for a last-name key), and matches
+    can be restricted to whole words.
+    """
+
+    def __init__(self, keys, aliases: dict[str, list[str]] = None, word_boundary: bool = True) -> None:
+        self.word_boundary = word_boundary
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for key in keys:
+            self._add(key, key)
+        for key, names in (aliases or {}).items():
+            for name in names:
+                self._add(name, key)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, key: str) -> None:
+        pattern = pattern.lower()
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(pattern), key))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # Inherit the matches that end at the failure state
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, message: str) -> list[str]:
+        """
+        Return the keys mentioned in the message, in order of first mention.
+        """
+        return list(self.count(message))
+
+    def count(self, message: str) -> dict[str, int]:
+        """
+        Count mentions of each key in the message, in order of first mention.
+        Each key is counted at most once per end position, so a full-name
+        alias does not also count as a mention of its last name.
+        """
+        text = message.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        counts = {}
+        node = 0
+        for end, char in enumerate(text, start=1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not output[node]:
+                continue
+            # A key and its alias can end at the same place ("Avery Lancaster"); count the key once
+            matched = set()
+            for length, key in output[node]:
+                if key in matched or (self.word_boundary and not self._is_word(text, end - length, end)):
+                    continue
+                matched.add(key)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    @staticmethod
+    def _is_word(text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
+
+
+def benchmark(n_keys: int = 20_000, n_messages: int = 200, seed: int = 42) -> None:
+    """
+    Compare the automaton against the per-key substring loop on synthetic names.
+    """
+    rng = random.Random(seed)
+    keys = list({"".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))).title() for _ in range(n_keys)})
+    messages = [
+        f"Who is {rng.choice(keys)} and how does {rng.choice(keys)} relate to Carllm?" for _ in range(n_messages)
+    ]
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keys)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for message in messages:
+        [key for key in keys if key.lower() in message.lower()]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for message in messages:
+        matcher.find(message)
+    automaton_time = time.perf_counter() - start
+
+    print(f"{len(keys)} keys, {len(messages)} messages")
+    print(f"Automaton build: {build_time * 1000:.1f} ms")
+    print(f"Substring loop:  {loop_time / len(messages) * 1e6:.1f} us/message")
+    print(f"Aho-Corasick:    {automaton_time / len(messages) * 1e6:.1f} us/message")
+
+
+if __name__ == "__main__":
+    benchmark()
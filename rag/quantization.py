@@ -0,0 +1,138 @@
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8 quantization. Returns the codes and the scale of
+    each row, so that vectors ~= codes * scales[:, None].
+    """
+    row_max = np.abs(vectors).max(axis=1)
+    row_max[row_max == 0] = 1.0
+    codes = np.round(vectors / row_max[:, None] * 127).astype(np.int8)
+    return codes, (row_max / 127).astype(np.float32)
+
+
+def truncate_dimensions(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Keep the leading dimensions and re-normalize. This matches requesting
+    fewer dimensions from the API for text-embedding-3 models, whose leading
+    dimensions carry most of the signal; for older models it loses recall.
+    """
+    vectors = np.asarray(vectors[:, :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class ProductQuantizer:
+    """
+    Product quantization: vectors are split into n_subvectors slices, and
+    each slice is replaced by the index of its nearest centroid in a
+    per-slice codebook of n_centroids (at most 256, one byte per slice).
+
+    Inner products with a query are computed from lookup tables of the
+    query slices against every centroid, so a vector costs n_subvectors
+    table reads instead of a full dot product.
+    """
+
+    def __init__(self, n_subvectors: int = 96, n_centroids: int = 256, iterations: int = 15, train_size: int = 50_000, seed: int = 42) -> None:
+        if n_centroids > 256:
+            raise ValueError("n_centroids must be at most 256 to fit codes in one byte")
+        self.n_subvectors = n_subvectors
+        self.n_centroids = n_centroids
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+
+    def fit(self, vectors: np.ndarray) -> "ProductQuantizer":
+        """
+        Train one k-means codebook per slice on a sample of the vectors.
+        """
+        n, dimensions = vectors.shape
+        if dimensions % self.n_subvectors:
+            raise ValueError(f"{dimensions} dimensions cannot be split into {self.n_subvectors} subvectors")
+        rng = np.random.default_rng(self.seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, size=min(n, self.train_size), replace=False))], dtype=np.float32)
+        n_centroids = min(self.n_centroids, len(sample))
+        sub = dimensions // self.n_subvectors
+
+        centroids = np.zeros((self.n_subvectors, n_centroids, sub), dtype=np.float32)
+        for j in range(self.n_subvectors):
+            part = sample[:, j * sub:(j + 1) * sub]
+            codebook = part[rng.choice(len(part), size=n_centroids, replace=False)]
+            for _ in range(self.iterations):
+                assignment = self._nearest(part, codebook)
+                sums = np.zeros_like(codebook)
+                np.add.at(sums, assignment, part)
+                counts = np.bincount(assignment, minlength=n_centroids)
+                # Empty centroids are re-seeded from random samples
+                empty = counts == 0
+                sums[empty] = part[rng.choice(len(part), size=int(empty.sum()))]
+                counts[empty] = 1
+                codebook = sums / counts[:, None]
+            centroids[j] = codebook
+        self.centroids = centroids
+        logger.info(f"Trained PQ codebooks: {self.n_subvectors} x {n_centroids} centroids on {len(sample)} vectors")
+        return self
+
+    @staticmethod
+    def _nearest(part: np.ndarray, codebook: np.ndarray) -> np.ndarray:
+        # argmin |x - c|^2 == argmax 2 x.c - |c|^2
+        return np.argmax(2 * part @ codebook.T - (codebook**2).sum(axis=1), axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        sub = self.centroids.shape[2]
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        for j in range(self.n_subvectors):
+            codes[:, j] = self._nearest(vectors[:, j * sub:(j + 1) * sub], self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate([self.centroids[j][codes[:, j]] for j in range(self.n_subvectors)], axis=1)
+
+    def lookup_tables(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Inner products of each query slice with each centroid, shaped
+        (n_queries, n_subvectors, n_centroids).
+        """
+        sub = self.centroids.shape[2]
+        slices = queries.reshape(len(queries), self.n_subvectors, sub)
+        return np.einsum("qjd,jcd->qjc", slices, self.centroids)
+
+    def scores(self, tables: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products of the queries behind tables with the
+        encoded vectors, shaped (n_queries, n_vectors).
+        """
+        scores = np.zeros((len(tables), len(codes)), dtype=np.float32)
+        for j in range(self.n_subvectors):
+            scores += tables[:, j, codes[:, j]]
+        return scores
+
+    def save(self, path: str) -> None:
+        np.save(path, self.centroids)
+
+    @classmethod
+    def load(cls, path: str) -> "ProductQuantizer":
+        centroids = np.load(path)
+        quantizer = cls(n_subvectors=centroids.shape[0], n_centroids=centroids.shape[1])
+        quantizer.centroids = centroids
+        return quantizer
+
+
+def memory_bytes(path: str) -> int:
+    """
+    Bytes of the files a flat index searches in memory, excluding the
+    full-precision vectors read only for rescoring and the text sidecar.
+    """
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in ("vectors.npy", "scales.npy", "pq_centroids.npy")
+        if os.path.exists(os.path.join(path, name))
+    )
@@ -1,17 +1,37 @@
 import os
+import sys
 import glob
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator
+import json
+import hashlib
+import time
+from functools import partial
 from dotenv import load_dotenv
 import gradio as gr
 import logging
-from langchain.document_loaders import DirectoryLoader, TextLoader
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.schema import Document
 from openai import OpenAI
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_chroma import Chroma
 import numpy as np
+from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
+import plotly.colors
 import plotly.graph_objects as go
+from embedding_cache import CachedEmbeddings
+from embedding_pipeline import run_embedding_pipeline
+from retrieval import ChromaIndex, Retriever, format_context
+from flat_index import FlatIndex, export_flat_index, is_stale
+from ann_index import open_ann_index
+from bm25_index import BM25Index, HybridRetriever, build_bm25_index
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from streaming import cumulative, openai_deltas
+from history import HistoryCompactor, history_budget, openai_summarizer
 
 # Set up logging configuration
 logging.basicConfig(
@@ -22,72 +42,356 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-embeddings = OpenAIEmbeddings()
 MODEL = "gpt-4o-mini"
 DB_NAME = "vector_db"
+# float16, int8 or pq shrink the searched vectors; candidates are rescored at full precision
+FLAT_INDEX_DTYPE = "float32"
+FLAT_INDEX = f"{DB_NAME}_flat_{FLAT_INDEX_DTYPE}"
+ANN_INDEX = f"{DB_NAME}_ann"
+BM25_INDEX = f"{DB_NAME}_bm25"
+# Exact search over the flat index is fast enough below this many chunks
+ANN_MIN_CHUNKS = 100_000
+EMBEDDING_CACHE = "embedding_cache.db"
+# Set to e.g. 512 to request reduced-dimension text-embedding-3-small vectors; None keeps the default model
+EMBEDDING_DIMENSIONS = None
+if EMBEDDING_DIMENSIONS:
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small", dimensions=EMBEDDING_DIMENSIONS), EMBEDDING_CACHE)
+else:
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(), EMBEDDING_CACHE)
+history_compactor = HistoryCompactor(openai_summarizer(openai_client), token_budget=history_budget(MODEL))
+
+
+def chunk_id(chunk: Document) -> str:
+    """
+    Content hash of a chunk, used as its id in the vector store.
+    """
+    digest = hashlib.sha256()
+    for part in (chunk.page_content, chunk.metadata.get("doc_type", ""), chunk.metadata.get("source", "")):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def manifest_path(db_name: str) -> str:
+    """
+    Path of the indexing manifest kept next to the persist directory.
+    """
+    return f"{os.path.normpath(db_name)}_manifest.json"
+
+
+def read_manifest(db_name: str) -> dict:
+    path = manifest_path(db_name)
+    if not os.path.exists(path) or not os.path.exists(db_name):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_manifest(db_name: str) -> dict:
+    """
+    Load the indexing manifest, mapping each source path to its chunk ids.
+    """
+    return read_manifest(db_name).get("sources", {})
+
+
+def save_manifest(db_name: str, sources: dict, embedding_model: str = None) -> None:
+    """
+    Save the indexing manifest atomically, unless it is unchanged.
+    """
+    manifest = {"version": 1, "embedding_model": embedding_model, "sources": sources}
+    if read_manifest(db_name) == manifest:
+        return
+    path = manifest_path(db_name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_fingerprint(db_name: str) -> str:
+    """
+    Hash of the embedding model and indexed chunk ids. Derived indexes store
+    it, so they are rebuilt only when the collection's content changes.
+    """
+    manifest = read_manifest(db_name)
+    digest = hashlib.sha256(str(manifest.get("embedding_model")).encode("utf-8"))
+    for id_ in sorted(id_ for entry in manifest.get("sources", {}).values() for id_ in entry["chunks"]):
+        digest.update(id_.encode("utf-8"))
+    return digest.hexdigest()
 
 
 def create_vector_store(
-        documents: list[Document],
+        documents: Iterable[Document],
         embeddings: OpenAIEmbeddings,
-        db_name: str = "vector_db"
+        db_name: str = "vector_db",
+        incremental: bool = False,
+        batch_size: int = 1000,
+        max_in_flight: int = 4,
+        window_size: int = 2000,
+        ann_index=None,
     ) -> Chroma:
 
     """
-    Create a vector store from a list of documents.
+    Create a vector store from an iterable of documents.
+
+    With incremental=True the existing collection is kept: only chunks whose
+    content hash is not yet indexed are embedded, and chunks that no longer
+    exist (changed or deleted sources) are removed.
+
+    Documents are consumed in windows of window_size, so a generator input is
+    never materialised; only chunk ids are kept for the whole corpus. Each
+    window runs through the concurrent, rate-limit-aware embedding pipeline
+    with at most max_in_flight batch requests outstanding.
+
+    An ann_index is kept in step with the collection: new chunks are added
+    as they are embedded, stale ones removed, and chunks it is missing are
+    back-filled from the stored embeddings. It is saved to its path when
+    anything changed.
     """
-    
-    # Check if a Chroma Datastore already exists - if so, delete the collection to start from scratch
-    if os.path.exists(db_name):
-        Chroma(persist_directory=db_name, embedding_function=embeddings).delete_collection()
 
-    vectorstore = Chroma.from_documents(documents=documents, embedding=embeddings, persist_directory=db_name)
-    logger.info(f"Vectorstore created with {vectorstore._collection.count()} documents")
+    embedding_model = getattr(embeddings, "model", None)
+    indexed_model = read_manifest(db_name).get("embedding_model")
+    if incremental and indexed_model and indexed_model != embedding_model:
+        # Vectors from different models (or dimensions) cannot share a collection
+        logger.warning(f"Store was embedded with {indexed_model}, not {embedding_model}; rebuilding it")
+        incremental = False
+
+    if not incremental:
+        # Check if a Chroma Datastore already exists - if so, delete the collection to start from scratch
+        if os.path.exists(db_name):
+            Chroma(persist_directory=db_name, embedding_function=embeddings).delete_collection()
+        if ann_index is not None:
+            # Its vectors may come from another model or have other dimensions
+            ann_index.reset()
+
+    vectorstore = Chroma(persist_directory=db_name, embedding_function=embeddings)
+
+    indexed_ids = set()
+    if incremental:
+        # Use the manifest as the record of what is indexed, unless it is out of sync with the collection
+        previous = load_manifest(db_name)
+        indexed_ids = {id_ for entry in previous.values() for id_ in entry["chunks"]}
+        if len(indexed_ids) != vectorstore._collection.count():
+            logger.info("Manifest missing or out of sync, reading ids from the collection")
+            indexed_ids = set(vectorstore.get(include=[])["ids"])
+
+    # Key chunks by content hash, which also drops exact duplicates
+    seen_ids = set()
+    sources = {}
+
+    async def embed_windows() -> int:
+        # All windows share one event loop: the async embeddings client is bound to the loop it first ran on
+        embedded = 0
+        for window in batched(documents, window_size):
+            new_chunks = {}
+            for chunk in window:
+                id_ = chunk_id(chunk)
+                if id_ in seen_ids:
+                    continue
+                seen_ids.add(id_)
+                source = chunk.metadata.get("source", "")
+                entry = sources.setdefault(source, {"doc_type": chunk.metadata.get("doc_type", ""), "chunks": []})
+                entry["chunks"].append(id_)
+                if id_ not in indexed_ids:
+                    new_chunks[id_] = chunk
+            if new_chunks:
+                await run_embedding_pipeline(
+                    new_chunks, embeddings, vectorstore, max_in_flight=max_in_flight, ann_index=ann_index
+                )
+                embedded += len(new_chunks)
+        return embedded
+
+    embedded = asyncio.run(embed_windows())
+
+    stale_ids = [id_ for id_ in indexed_ids if id_ not in seen_ids]
+    for start in range(0, len(stale_ids), batch_size):
+        vectorstore.delete(ids=stale_ids[start:start + batch_size])
+
+    if ann_index is not None:
+        removed = [id_ for id_ in ann_index.ids() if id_ not in seen_ids]
+        ann_index.remove(removed)
+        missing = [id_ for id_ in seen_ids if id_ not in ann_index]
+        for start in range(0, len(missing), batch_size):
+            page = vectorstore._collection.get(ids=missing[start:start + batch_size], include=["embeddings", "metadatas"])
+            ann_index.add(page["ids"], page["embeddings"], [metadata.get("doc_type", "") for metadata in page["metadatas"]])
+        if missing:
+            logger.info(f"Back-filled {len(missing)} chunks into the ANN index")
+        if embedded or removed or missing or not incremental:
+            ann_index.save()
+
+    save_manifest(db_name, sources, embedding_model)
+    logger.info(
+        f"Vectorstore ready: {embedded} chunks embedded, {len(stale_ids)} removed, "
+        f"{len(seen_ids) - embedded} unchanged ({vectorstore._collection.count()} documents)"
+    )
     return vectorstore
 
 
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Yield successive lists of at most size items from an iterable.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def read_document(path: str, doc_type: str) -> Document:
+    """
+    Read a markdown file into a Document tagged with its doc type.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return Document(page_content=f.read(), metadata={"source": path, "doc_type": doc_type})
+
+
+def iter_documents(parent_folder: list[str], max_workers: int = 8, max_pending: int = 32) -> Iterator[Document]:
+    """
+    Stream documents from the folders, reading files on a thread pool.
+
+    At most max_pending files are read ahead of the consumer, so a slow
+    downstream stage (splitting, embedding) holds back reading.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for folder in parent_folder:
+            # the folder name is the doc type
+            doc_type = os.path.basename(folder)
+            for path in sorted(glob.glob(os.path.join(folder, "**", "*.md"), recursive=True)):
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(read_document, path, doc_type))
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_chunks(documents: Iterable[Document], text_splitter: CharacterTextSplitter) -> Iterator[Document]:
+    """
+    Split documents one at a time, yielding chunks as they are produced.
+    """
+    for document in documents:
+        yield from text_splitter.split_documents([document])
+
+
 def load_documents(parent_folder: str) -> list[Document]:
     """
     Load documents from a parent folder.
     """
-    # set the text loader kwargs
-    text_loader_kwargs = {'encoding': 'utf-8'}
-    documents = []
-    for folder in parent_folder:
-        # get the folder name
-        doc_type = os.path.basename(folder)
-        # load the documents
-        loader = DirectoryLoader(folder, glob="**/*.md", loader_cls=TextLoader, loader_kwargs=text_loader_kwargs)
-        folder_docs = loader.load()
-        for doc in folder_docs:
-            # add the doc type to the metadata
-            doc.metadata["doc_type"] = doc_type
-            # add the document to the list
-            documents.append(doc)
-
+    documents = list(iter_documents(parent_folder))
     logger.info(f"Loaded {len(documents)} documents from {parent_folder}")
     return documents
 
 
+def sample_collection(
+        vectorstore: Chroma,
+        max_points: int = 5000,
+        page_size: int = 1000,
+        seed: int = 42,
+    ) -> dict:
+    """
+    Draw a sample of the collection, stratified by doc_type.
+
+    Metadatas are paged through first; embeddings are then fetched only for
+    the sampled ids, so the full embedding matrix is never loaded.
+    """
+    collection = vectorstore._collection
+    ids_by_type = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        for id_, metadata in zip(page['ids'], page['metadatas']):
+            ids_by_type.setdefault(metadata.get('doc_type', 'unknown'), []).append(id_)
+        offset += len(page['ids'])
+
+    # Each doc type gets a share of max_points proportional to its size, but at least a few points
+    total = sum(len(ids) for ids in ids_by_type.values())
+    rng = np.random.default_rng(seed)
+    sampled_ids = []
+    for doc_type in sorted(ids_by_type):
+        ids = ids_by_type[doc_type]
+        quota = min(len(ids), max(10, round(max_points * len(ids) / max(total, 1))))
+        sampled_ids.extend(rng.choice(ids, size=quota, replace=False).tolist() if quota < len(ids) else ids)
+    sampled_ids.sort()
+
+    vectors, documents, doc_types = [], [], []
+    for start in range(0, len(sampled_ids), page_size):
+        page = collection.get(ids=sampled_ids[start:start + page_size], include=['embeddings', 'documents', 'metadatas'])
+        # Chroma does not guarantee the order of results for an ids query
+        order = {id_: i for i, id_ in enumerate(page['ids'])}
+        for id_ in sampled_ids[start:start + page_size]:
+            i = order[id_]
+            vectors.append(np.asarray(page['embeddings'][i], dtype=np.float32))
+            documents.append(page['documents'][i])
+            doc_types.append(page['metadatas'][i].get('doc_type', 'unknown'))
+
+    logger.info(f"Sampled {len(sampled_ids)} of {total} vectors for visualization")
+    return {'ids': sampled_ids, 'vectors': np.vstack(vectors), 'documents': documents, 'doc_types': doc_types}
+
+
+def project_vectors(
+        ids: list[str],
+        vectors: np.ndarray,
+        n_components: int,
+        pca_components: int = 50,
+        cache_dir: str = None,
+    ) -> np.ndarray:
+    """
+    Project vectors to 2D/3D with PCA pre-reduction followed by Barnes-Hut t-SNE.
 
-def visualize_vector_space(vectorstore: Chroma, type = "2D") -> None:
+    Projections are cached in cache_dir, keyed by the (content-hashed) ids,
+    the vectors themselves and the parameters, so re-plotting the same
+    sample skips t-SNE while a new embedding model or dimension does not
+    reuse a stale projection.
+    """
+    cache_path = None
+    if cache_dir:
+        digest = hashlib.sha256("\n".join(ids + [str(n_components), str(pca_components)]).encode("utf-8"))
+        digest.update(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        key = digest.hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.npy")
+        if os.path.exists(cache_path):
+            logger.info(f"Loaded cached projection from {cache_path}")
+            return np.load(cache_path)
+
+    if vectors.shape[1] > pca_components and len(vectors) > pca_components:
+        vectors = PCA(n_components=pca_components, svd_solver='randomized', random_state=42).fit_transform(vectors)
+    perplexity = min(30.0, max(1.0, (len(vectors) - 1) / 3))
+    tsne = TSNE(n_components=n_components, method='barnes_hut', perplexity=perplexity, init='pca', random_state=42)
+    reduced_vectors = tsne.fit_transform(vectors)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(cache_path, reduced_vectors)
+    return reduced_vectors
+
+
+def visualize_vector_space(
+        vectorstore: Chroma,
+        type = "2D",
+        max_points: int = 5000,
+        cache_dir: str = f"{DB_NAME}_projections",
+    ) -> None:
 
     """
     Visualize the vector space of the vector store.
+
+    At most max_points vectors are plotted, sampled per doc_type, and the
+    projection is cached in cache_dir.
     """
-    collection = vectorstore._collection
-    result = collection.get(include=['embeddings', 'documents', 'metadatas'])
-    vectors = np.array(result['embeddings'])
-    documents = result['documents']
-    doc_types = [metadata['doc_type'] for metadata in result['metadatas']]
-    colors = [['blue', 'green', 'red', 'orange'][['products', 'employees', 'contracts', 'company'].index(t)] for t in doc_types]
+    if type not in ("2D", "3D"):
+        raise ValueError(f"Invalid visualization type: {type}. Choose between '2D' or '3D'.")
 
-    
+    sample = sample_collection(vectorstore, max_points=max_points)
+    documents = sample['documents']
+    doc_types = sample['doc_types']
+    palette = plotly.colors.qualitative.Plotly
+    type_colors = {t: palette[i % len(palette)] for i, t in enumerate(sorted(set(doc_types)))}
+    colors = [type_colors[t] for t in doc_types]
 
     if type == "2D":
         logger.info("Visualizing vector space in 2D...")
-        tsne = TSNE(n_components=2, random_state=42)
-        reduced_vectors = tsne.fit_transform(vectors)
+        reduced_vectors = project_vectors(sample['ids'], sample['vectors'], 2, cache_dir=cache_dir)
 
         # Create the 2D scatter plot
         fig = go.Figure(data=[go.Scatter(
@@ -107,10 +411,9 @@ def visualize_vector_space(vectorstore: Chroma, type = "2D") -> None:
             margin=dict(r=20, b=10, l=10, t=40)
         )
 
-    elif type == "3D":
+    else:
         logger.info("Visualizing vector space in 3D...")
-        tsne = TSNE(n_components=3, random_state=42)
-        reduced_vectors = tsne.fit_transform(vectors)
+        reduced_vectors = project_vectors(sample['ids'], sample['vectors'], 3, cache_dir=cache_dir)
 
         # Create the 3D scatter plot
         fig = go.Figure(data=[go.Scatter3d(
@@ -130,12 +433,40 @@ def visualize_vector_space(vectorstore: Chroma, type = "2D") -> None:
             height=700,
             margin=dict(r=20, b=10, l=10, t=40)
         )
-        
-    else:
-        raise ValueError(f"Invalid visualization type: {type}. Choose between '2D' or '3D'.")
 
     fig.show()
 
+def chat(message: str, history: list[dict], doc_types: list[str] = None, retriever: HybridRetriever = None):
+    """
+    Answer from the chunks retrieved for the message, streaming the reply.
+    Retrieval and generation latencies are logged separately.
+    """
+    system_message = "You are an expert in answering accurate questions about Insurellm, the Insurance Tech company. Give brief, accurate answers. If you don't know the answer, say so. Do not make anything up if you haven't been provided with relevant context."
+    documents = retriever.retrieve(message, doc_types)
+    retrieval_time = retriever.timings[-1]["total"]
+
+    messages = [{"role": "system", "content": system_message}] + history_compactor.compact(history)
+    if documents:
+        message = "".join([
+            message,
+            "\n\nThe following additional context might be relevant in answering this question:\n\n",
+            format_context(documents),
+        ])
+    messages.append({"role": "user", "content": message})
+
+    start = time.perf_counter()
+    first_token_time = None
+    stream = openai_client.chat.completions.create(model=MODEL, messages=messages, stream=True)
+    for response in cumulative(openai_deltas(stream)):
+        if first_token_time is None:
+            first_token_time = time.perf_counter() - start
+        yield response
+    logger.info(
+        f"Retrieval {retrieval_time * 1000:.1f} ms ({len(documents)} chunks), "
+        f"first token {(first_token_time or 0) * 1000:.0f} ms, generation {time.perf_counter() - start:.2f} s"
+    )
+
+
 if __name__ == "__main__":
 
     # --------------------------------------------------------------
@@ -143,40 +474,31 @@ if __name__ == "__main__":
     # --------------------------------------------------------------
 
     parent_folder = glob.glob("rag/data/*")
-    documents = load_documents(parent_folder)
-    # print("Documents: ", documents)
-
-    # print the metadata
-    # print(documents[0].metadata)
-    # print the page content
-    # print(documents[0].page_content)
+    documents = iter_documents(parent_folder)
 
     # --------------------------------------------------------------
     # Step 2: Split documents
     # --------------------------------------------------------------
 
+    # Documents are streamed through the splitter into the vector store,
+    # so neither the documents nor the chunks are held in memory at once
     text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(documents)
-    print("Number of chunks: ", len(chunks)) #123
-    # print the first chunk
-    # print("First chunk: ", chunks[0].page_content)
-
-    # print the document types
-    doc_types = set(chunk.metadata['doc_type'] for chunk in chunks)
-    print(f"Document types found: {', '.join(doc_types)}")
-
-    # print the chunks that contain "CEO"
-    # for chunk in chunks:
-    #     if 'CEO' in chunk.page_content:
-    #         print(chunk)
-    #         print("_________")
-
+    chunks = iter_chunks(documents, text_splitter)
 
     # --------------------------------------------------------------
     # Step 3: Create a vector store
     # --------------------------------------------------------------
 
-    vectorstore = create_vector_store(chunks, embeddings, DB_NAME)
+    # The ANN index is only kept, and held in memory, once the store is large enough to use it.
+    # When the store first crosses the threshold, the next run back-fills it from the collection.
+    indexed_chunks = sum(len(entry["chunks"]) for entry in load_manifest(DB_NAME).values())
+    ann_index = open_ann_index(ANN_INDEX) if indexed_chunks >= ANN_MIN_CHUNKS else None
+    vectorstore = create_vector_store(chunks, embeddings, DB_NAME, incremental=True, ann_index=ann_index)
+    print("Number of chunks: ", vectorstore._collection.count()) #123
+
+    # print the document types
+    doc_types = set(entry["doc_type"] for entry in load_manifest(DB_NAME).values())
+    print(f"Document types found: {', '.join(doc_types)}")
 
     # Get one vector and find how many dimensions it has
     collection = vectorstore._collection
@@ -184,6 +506,7 @@ if __name__ == "__main__":
     dimensions = len(sample_embedding)
     print(f"The vectors have {dimensions:,} dimensions") #1,536 dimensions
     print("Sample embedding: ", sample_embedding)
+    logger.info(f"Embedding cache: {embeddings.stats()}")
 
 
     # --------------------------------------------------------------
@@ -191,3 +514,31 @@ if __name__ == "__main__":
     # --------------------------------------------------------------
 
     visualize_vector_space(vectorstore, type="2D")
+
+
+    # --------------------------------------------------------------
+    # Step 5: Chat over the vector store
+    # --------------------------------------------------------------
+
+    fingerprint = manifest_fingerprint(DB_NAME)
+    if ann_index is not None and len(ann_index) >= ANN_MIN_CHUNKS:
+        retriever = Retriever(ChromaIndex(vectorstore, ann_index), embeddings)
+    else:
+        # Serve queries from a memory-mapped export of the collection, refreshed when the store changes
+        if is_stale(FLAT_INDEX, fingerprint):
+            export_flat_index(vectorstore, FLAT_INDEX, dtype=FLAT_INDEX_DTYPE, fingerprint=fingerprint)
+        retriever = Retriever(FlatIndex(FLAT_INDEX), embeddings)
+
+    # Exact names and products are matched lexically, and most such lookups skip the embedding call
+    if is_stale(BM25_INDEX, fingerprint):
+        build_bm25_index(vectorstore, BM25_INDEX, fingerprint=fingerprint)
+    retriever = HybridRetriever(BM25Index(BM25_INDEX), retriever)
+    for question in ("Who is Alex Lancaster?", "What is the contract with Apex Reinsurance?", "What does Insurellm do?"):
+        print(question, [document.metadata["source"] for document in retriever.retrieve(question)])
+    logger.info(f"Retrieval latency: {retriever.latency_stats()}")
+
+    gr.ChatInterface(
+        partial(chat, retriever=retriever),
+        type="messages",
+        additional_inputs=[gr.CheckboxGroup(choices=sorted(doc_types), label="Document types")],
+    ).launch()
@@ -1,9 +1,16 @@
 import os
+import sys
 import glob
 from dotenv import load_dotenv
 import gradio as gr
 from openai import OpenAI
 import logging
+from functools import partial
+from keyword_matcher import KeywordMatcher
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from tokens import count_tokens, truncate_to_tokens
+from streaming import cumulative, openai_deltas
+from history import HistoryCompactor, history_budget, openai_summarizer
 
 # Set up logging configuration
 logging.basicConfig(
@@ -15,41 +22,86 @@ logger = logging.getLogger(__name__)
 
 openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MODEL = "gpt-4o-mini"
+CONTEXT_TOKEN_BUDGET = 2000
+# Older turns are summarized so each prompt carries a bounded amount of history
+history_compactor = HistoryCompactor(openai_summarizer(openai_client), token_budget=history_budget(MODEL))
+
+
+
+def get_relevant_context(message: str, context: dict, matcher: KeywordMatcher = None) -> list[str]:
+    # Build the matcher once when the context is loaded and pass it in; building it here is the slow path
+    if matcher is None:
+        matcher = KeywordMatcher(context)
+    return [context[context_title] for context_title in matcher.find(message)]
+
+def fit_to_budget(document: str, token_budget: int) -> str:
+    # Keep whole leading paragraphs while they fit, otherwise cut the first paragraph
+    paragraphs = []
+    used = 0
+    for paragraph in document.split("\n\n"):
+        tokens = count_tokens(paragraph)
+        if used + tokens > token_budget:
+            break
+        paragraphs.append(paragraph)
+        used += tokens
+    if not paragraphs:
+        return truncate_to_tokens(document, token_budget)
+    return "\n\n".join(paragraphs)
+
+def assemble_context(
+    message: str, context: dict, matcher: KeywordMatcher = None, token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> tuple[str, int]:
+    if matcher is None:
+        matcher = KeywordMatcher(context)
+    mentions = matcher.count(message)
+    # Documents mentioned most often come first; ties keep the order of first mention
+    ranked = sorted(mentions, key=lambda context_title: -mentions[context_title])
 
-
-
-def get_relevant_context(message: str, context: dict) -> list[str]:
     relevant_context = []
-    for context_title, context_details in context.items():
-        if context_title.lower() in message.lower():
-            relevant_context.append(context_details)
-    return relevant_context  
-
-def add_context(message: str, context: dict) -> str:
-    relevant_context = get_relevant_context(message, context)
-    if relevant_context:
-        message += "\n\nThe following additional context might be relevant in answering this question:\n\n"
-        for relevant in relevant_context:
-            message += relevant + "\n\n"
-    return message
-
-
-def chat(message: str, history: list[dict], context: dict):
+    used = 0
+    for context_title in ranked:
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        document = context[context_title]
+        tokens = count_tokens(document)
+        if tokens > remaining:
+            document = fit_to_budget(document, remaining)
+            tokens = count_tokens(document)
+        if document:
+            relevant_context.append(document)
+            used += tokens
+    return "\n\n".join(relevant_context), used
+
+def add_context(
+    message: str, context: dict, matcher: KeywordMatcher = None, token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> str:
+    relevant_context, context_tokens = assemble_context(message, context, matcher, token_budget)
+    if not relevant_context:
+        return message
+    logger.info(f"Added {context_tokens} context tokens (budget {token_budget}) to a {count_tokens(message)} token message")
+    return "".join([
+        message,
+        "\n\nThe following additional context might be relevant in answering this question:\n\n",
+        relevant_context,
+        "\n\n",
+    ])
+
+
+def chat(message: str, history: list[dict], context: dict, matcher: KeywordMatcher = None):
     system_message = "You are an expert in answering accurate questions about Insurellm, the Insurance Tech company. Give brief, accurate answers. If you don't know the answer, say so. Do not make anything up if you haven't been provided with relevant context."
-    messages = [{"role": "system", "content": system_message}] + history
-    message = add_context(message, context)
+    messages = [{"role": "system", "content": system_message}] + history_compactor.compact(history)
+    message = add_context(message, context, matcher)
     messages.append({"role": "user", "content": message})
 
     stream = openai_client.chat.completions.create(model=MODEL, messages=messages, stream=True)
 
-    response = ""
-    for chunk in stream:
-        response += chunk.choices[0].delta.content or ''
-        yield response
+    yield from cumulative(openai_deltas(stream))
 
 if __name__ == "__main__":
 
     context = {}
+    aliases = {}
 
     # --------------------------------------------------------------
     # Step 1: Get employee data
@@ -64,6 +116,8 @@ if __name__ == "__main__":
         with open(employee, "r", encoding="utf-8") as f:
             doc = f.read()
         context[name]=doc
+        # the full name from the file name is an alias for the last name
+        aliases[name] = [os.path.basename(employee)[:-3]]
 
     logger.info(f"Found {len(context)} employees")
     print("Context: ", context)
@@ -91,15 +145,18 @@ if __name__ == "__main__":
     # Step 3: DIY RAG
     # --------------------------------------------------------------
 
-    result = get_relevant_context("Who is lancaster?", context)
+    # Build the keyword matcher once for all chat turns
+    matcher = KeywordMatcher(context, aliases)
+
+    result = get_relevant_context("Who is lancaster?", context, matcher)
     print("Result: ", result)
 
-    result = get_relevant_context("Who is Avery and what is carllm?", context)
+    result = get_relevant_context("Who is Avery and what is carllm?", context, matcher)
     print("Result: ", result)
 
-    result = add_context("Who is Alex Lancaster?", context)
+    result = add_context("Who is Alex Lancaster?", context, matcher)
     print("Result: ", result)
 
-    view = gr.ChatInterface(chat, type="messages").launch()
+    view = gr.ChatInterface(partial(chat, context=context, matcher=matcher), type="messages").launch()
 
 
@@ -0,0 +1,172 @@
+import logging
+import time
+from collections import deque
+
+import numpy as np
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+
+def doc_type_filter(doc_types: list[str] = None) -> dict:
+    """
+    Chroma where clause restricting results to the given doc types.
+    """
+    if not doc_types:
+        return None
+    if len(doc_types) == 1:
+        return {"doc_type": doc_types[0]}
+    return {"doc_type": {"$in": list(doc_types)}}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.5) -> list[int]:
+    """
+    Maximal marginal relevance: greedily pick k candidates that are similar
+    to the query but not to the candidates already picked. Returns indices
+    into candidates, in pick order.
+
+    Similarities are computed once as matrix products, and the maximum
+    similarity to the picked set is updated with one vector operation per
+    pick, so the selection costs O(k * n) on top of the n x n product.
+    """
+    if len(candidates) == 0 or k <= 0:
+        return []
+    candidates = normalize(candidates)
+    # Indexes with reduced dimensions return only the leading dimensions
+    query = query[: candidates.shape[1]]
+    relevance = candidates @ normalize(query)
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+class ChromaIndex:
+    """
+    Candidate search over a Chroma collection.
+
+    An index returns, for a query vector, its nearest candidates with their
+    documents, metadatas and embeddings, optionally restricted to doc types.
+    With an ann_index, the candidate ids come from it and only their
+    contents are read from Chroma.
+    """
+
+    def __init__(self, vectorstore, ann_index=None) -> None:
+        self.collection = vectorstore._collection
+        self.ann_index = ann_index
+
+    def candidates(self, query_vector: np.ndarray, fetch_k: int, doc_types: list[str] = None) -> dict:
+        if self.ann_index is not None:
+            return self._ann_candidates(query_vector, fetch_k, doc_types)
+        result = self.collection.query(
+            query_embeddings=[query_vector.tolist()],
+            n_results=fetch_k,
+            where=doc_type_filter(doc_types),
+            include=["documents", "metadatas", "embeddings"],
+        )
+        return {
+            "ids": result["ids"][0],
+            "documents": result["documents"][0],
+            "metadatas": result["metadatas"][0],
+            "embeddings": np.asarray(result["embeddings"][0], dtype=np.float32).reshape(len(result["ids"][0]), -1),
+        }
+
+    def vectors(self, ids: list[str]) -> np.ndarray:
+        """
+        Stored embeddings of the given ids, in the order of ids.
+        """
+        result = self.collection.get(ids=ids, include=["embeddings"])
+        position = {id_: i for i, id_ in enumerate(result["ids"])}
+        return np.asarray([result["embeddings"][position[id_]] for id_ in ids], dtype=np.float32).reshape(len(ids), -1)
+
+    def _ann_candidates(self, query_vector: np.ndarray, fetch_k: int, doc_types: list[str] = None) -> dict:
+        ids = [id_ for id_, _ in self.ann_index.search(query_vector, fetch_k, doc_types)[0]]
+        result = self.collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+        # Chroma does not guarantee the order of results for an ids query
+        order = [result["ids"].index(id_) for id_ in ids if id_ in result["ids"]]
+        return {
+            "ids": [result["ids"][i] for i in order],
+            "documents": [result["documents"][i] for i in order],
+            "metadatas": [result["metadatas"][i] for i in order],
+            "embeddings": np.asarray([result["embeddings"][i] for i in order], dtype=np.float32).reshape(len(order), -1),
+        }
+
+
+class Retriever:
+    """
+    Query-time retrieval: embed the query once, fetch fetch_k candidates
+    pre-filtered by doc type, then re-rank them to k with MMR.
+
+    Embedding, search and re-ranking latencies of the last max_timings
+    queries are kept in self.timings, separately from any generation that
+    follows.
+    """
+
+    def __init__(
+        self,
+        index,
+        embeddings,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        max_timings: int = 10_000,
+    ) -> None:
+        self.index = index
+        self.embeddings = embeddings
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.timings = deque(maxlen=max_timings)
+
+    def retrieve(self, query: str, doc_types: list[str] = None, k: int = None) -> list[Document]:
+        k = k or self.k
+        start = time.perf_counter()
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        embedded = time.perf_counter()
+        candidates = self.index.candidates(query_vector, max(self.fetch_k, k), doc_types)
+        searched = time.perf_counter()
+        order = mmr(query_vector, candidates["embeddings"], k, self.lambda_mult)
+        reranked = time.perf_counter()
+
+        self.timings.append(
+            {
+                "embed": embedded - start,
+                "search": searched - embedded,
+                "rerank": reranked - searched,
+                "total": reranked - start,
+            }
+        )
+        return [
+            Document(page_content=candidates["documents"][i], metadata={**candidates["metadatas"][i], "id": candidates["ids"][i]})
+            for i in order
+        ]
+
+    def latency_stats(self) -> dict:
+        """
+        p50/p95/p99 of each retrieval stage, in seconds.
+        """
+        stats = {"queries": len(self.timings)}
+        for stage in ("embed", "search", "rerank", "total"):
+            values = [timing[stage] for timing in self.timings]
+            for p in (50, 95, 99):
+                stats[f"p{p}_{stage}"] = float(np.percentile(values, p)) if values else 0.0
+        return stats
+
+
+def format_context(documents: list[Document]) -> str:
+    return "\n\n".join(f"[{document.metadata.get('source', '')}]\n{document.page_content}" for document in documents)
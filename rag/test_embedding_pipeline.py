@@ -0,0 +1,213 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import embedding_pipeline
+from embedding_pipeline import embed_with_retry, run_embedding_pipeline
+from langchain.schema import Document
+from langchain_openai import OpenAIEmbeddings
+
+DIMENSIONS = 4
+
+
+class FakeEmbeddingsService:
+    """
+    State shared by the handler threads of the fake embeddings server.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Number of upcoming requests to answer with 429, and a status to fail every request with
+        self.reject = 0
+        self.fail_status = None
+        self.latency = 0.0
+
+
+def fake_vector(text: str) -> list[float]:
+    return [float(len(text)), 1.0, 0.0, 0.0]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        service = self.server.service
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with service.lock:
+            service.requests += 1
+            service.in_flight += 1
+            service.max_in_flight = max(service.max_in_flight, service.in_flight)
+            rejected = service.reject > 0
+            if rejected:
+                service.reject -= 1
+                service.rate_limited += 1
+        try:
+            time.sleep(service.latency)
+            if service.fail_status:
+                self._send_json(service.fail_status, {"error": {"message": "failed", "type": "server_error"}})
+                return
+            if rejected:
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}})
+                return
+            data = []
+            for index, text in enumerate(request["input"]):
+                vector = fake_vector(text)
+                if request.get("encoding_format") == "base64":
+                    vector = base64.b64encode(np.array(vector, dtype=np.float32).tobytes()).decode("ascii")
+                data.append({"object": "embedding", "index": index, "embedding": vector})
+            self._send_json(
+                200,
+                {
+                    "object": "list",
+                    "data": data,
+                    "model": request["model"],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                },
+            )
+        finally:
+            with service.lock:
+                service.in_flight -= 1
+
+
+class FakeCollection:
+    def __init__(self) -> None:
+        self.upserts = []
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.upserts.append(dict(zip(ids, embeddings)))
+
+
+class FakeVectorStore:
+    def __init__(self) -> None:
+        self._collection = FakeCollection()
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.service = FakeEmbeddingsService()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def embeddings(server):
+    # The client's own retries are off so that 429s reach embed_with_retry
+    return OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        api_key="test",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        max_retries=0,
+        check_embedding_ctx_length=False,
+    )
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    """
+    Record the backoff windows instead of sleeping through them.
+    """
+    windows = []
+
+    def uniform(low: float, high: float) -> float:
+        windows.append(high)
+        return 0.0
+
+    monkeypatch.setattr(embedding_pipeline.random, "uniform", uniform)
+    return windows
+
+
+def make_chunks(count: int) -> dict[str, Document]:
+    return {f"chunk-{i}": Document(page_content="x" * (i + 1), metadata={"doc_type": "test"}) for i in range(count)}
+
+
+def test_embed_with_retry_backs_off_exponentially_on_429(server, embeddings, backoff):
+    server.service.reject = 3
+
+    vectors = asyncio.run(embed_with_retry(embeddings, ["a", "bb"], base_delay=0.5))
+
+    assert vectors == [fake_vector("a"), fake_vector("bb")]
+    assert server.service.requests == 4
+    assert backoff == [0.5, 1.0, 2.0]
+
+
+def test_embed_with_retry_caps_the_backoff_window(server, embeddings, backoff):
+    server.service.reject = 4
+
+    asyncio.run(embed_with_retry(embeddings, ["a"], base_delay=1.0, max_delay=3.0))
+
+    assert backoff == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_embed_with_retry_gives_up_after_max_retries(server, embeddings, backoff):
+    server.service.reject = 10
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(embed_with_retry(embeddings, ["a"], max_retries=2))
+
+    assert embedding_pipeline.is_rate_limit_error(error.value)
+    assert server.service.requests == 3
+
+
+def test_embed_with_retry_does_not_retry_other_errors(server, embeddings, backoff):
+    server.service.fail_status = 400
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(embed_with_retry(embeddings, ["a"]))
+
+    assert not embedding_pipeline.is_rate_limit_error(error.value)
+    assert server.service.requests == 1
+    assert backoff == []
+
+
+def test_pipeline_limits_batches_in_flight(server, embeddings, backoff):
+    server.service.latency = 0.05
+    chunks = make_chunks(24)
+    vectorstore = FakeVectorStore()
+
+    stats = asyncio.run(run_embedding_pipeline(chunks, embeddings, vectorstore, max_in_flight=3, max_batch_size=2))
+
+    assert stats["batches"] == 12
+    assert server.service.requests == 12
+    assert 1 < server.service.max_in_flight <= 3
+    upserted = {id_: vector for batch in vectorstore._collection.upserts for id_, vector in batch.items()}
+    assert upserted == {id_: fake_vector(chunk.page_content) for id_, chunk in chunks.items()}
+
+
+def test_pipeline_retries_rate_limited_batches(server, embeddings, backoff):
+    server.service.reject = 5
+    chunks = make_chunks(20)
+    vectorstore = FakeVectorStore()
+
+    stats = asyncio.run(run_embedding_pipeline(chunks, embeddings, vectorstore, max_in_flight=4, max_batch_size=4))
+
+    assert stats["batches"] == 5
+    assert server.service.rate_limited == 5
+    assert server.service.requests == 10
+    assert len(backoff) == 5
+    upserted = {id_ for batch in vectorstore._collection.upserts for id_ in batch}
+    assert upserted == set(chunks)
@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from crawl import SiteCrawl
+from fetcher import Fetcher
+from http_cache import HttpCache
+from utils import (
+    configure_user_prompt_brochure,
+    configure_user_prompt_for_links,
+    create_brochure,
+    useful_links,
+)
+
+# Batch brochure generation over a list of sites.
+# Usage: python batch.py urls.txt --output brochures.jsonl
+
+SYSTEM_PROMPT_FOR_LINKS = """You are provided with a list of links found on a webpage. \
+You are able to decide which of the links would be most relevant to include in a brochure about the company, \
+such as links to an About page, or a Company page, or Careers/Jobs pages.
+You should respond in JSON as in this example:
+{
+    "links": [
+        {"type": "about page", "url": "https://full.url/goes/here/about"},
+        {"type": "careers page", "url": "https://another.full.url/careers"}
+    ]
+}
+"""
+
+SYSTEM_PROMPT_BROCHURE = "You are an assistant that analyzes the contents of several relevant pages from a company website \
+and creates a short brochure about the company for prospective customers, investors and recruits. Respond in markdown.\
+Include details of company culture, customers and careers/jobs if you have the information."
+
+
+def read_sites(path: str) -> list[tuple[str, str]]:
+    """
+    Read "url" or "url,company name" lines; the name defaults to the domain.
+    """
+    sites = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            url, _, company_name = line.partition(",")
+            url = url.strip()
+            if not company_name.strip():
+                host = urlparse(url).netloc.removeprefix("www.")
+                company_name = host.split(".")[0].title()
+            sites.append((url, company_name.strip()))
+    return sites
+
+
+def completed_urls(output_path: str) -> set[str]:
+    """
+    URLs already summarized in the output file, used to resume after a crash.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from a crash
+                continue
+            if record.get("status") == "ok":
+                done.add(record["url"])
+    return done
+
+
+def process_site(
+    url: str, company_name: str, fetcher: Fetcher, llm_limit: threading.Semaphore
+) -> dict:
+    """
+    Run fetch, link selection, page fetch and brochure generation for one site.
+    HTTP work runs on the fetcher's pool; every LLM call, including the map
+    calls that condense oversized pages, holds llm_limit.
+    """
+    start = time.perf_counter()
+    crawl = SiteCrawl(url, fetcher)
+    user_prompt_for_links = configure_user_prompt_for_links(crawl.landing_page)
+    with llm_limit:
+        links = useful_links(SYSTEM_PROMPT_FOR_LINKS, user_prompt_for_links, crawl)
+    # Link selection is memoized on the crawl, so this only fetches the selected pages
+    stats = {}
+    user_prompt = configure_user_prompt_brochure(
+        url,
+        company_name,
+        SYSTEM_PROMPT_FOR_LINKS,
+        user_prompt_for_links,
+        crawl=crawl,
+        stats=stats,
+        llm_limit=llm_limit,
+    )
+    with llm_limit:
+        brochure = create_brochure(SYSTEM_PROMPT_BROCHURE, user_prompt, stats=stats)
+    return {
+        "url": url,
+        "company": company_name,
+        "status": "ok",
+        "links": json.loads(links).get("links", []),
+        "brochure": brochure,
+        "stages": stats,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def run_batch(
+    sites: list[tuple[str, str]],
+    output_path: str,
+    http_workers: int = 32,
+    llm_workers: int = 8,
+    per_host_limit: int = 2,
+    cache_dir: str = ".http_cache",
+) -> None:
+    """
+    Summarize sites with pipelined HTTP and LLM stages, appending one JSON
+    line per site. Sites already in the output are skipped, so a crashed
+    run can be restarted with the same arguments.
+    """
+    done = completed_urls(output_path)
+    pending = [(url, name) for url, name in sites if url not in done]
+    print(f"{len(sites)} sites, {len(done)} already done, {len(pending)} to process")
+
+    fetcher = Fetcher(
+        max_workers=http_workers,
+        per_host_limit=per_host_limit,
+        cache=HttpCache(cache_dir) if cache_dir else None,
+    )
+    llm_limit = threading.BoundedSemaphore(llm_workers)
+    # Enough site drivers to keep both stages busy; the limits above bound the actual work
+    max_in_flight = http_workers + llm_workers
+    processed = failed = 0
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(
+        max_workers=max_in_flight
+    ) as executor:
+        # Terminate a line left half-written by a crash before appending
+        if output.tell() > 0:
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    output.write("\n")
+        queue = iter(pending)
+        futures = {}
+
+        def submit_next() -> None:
+            site = next(queue, None)
+            if site is not None:
+                futures[executor.submit(process_site, *site, fetcher, llm_limit)] = site
+
+        for _ in range(max_in_flight):
+            submit_next()
+
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                url, company_name = futures.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {"url": url, "company": company_name, "status": "error", "error": str(e)}
+                    failed += 1
+                processed += 1
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                submit_next()
+
+            if processed and processed % 50 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{processed}/{len(pending)} sites, {processed / elapsed * 60:.1f} sites/minute")
+
+    fetcher.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Processed {processed} sites ({failed} failed) in {elapsed:.1f}s, "
+        f"{processed / elapsed * 60 if elapsed else 0.0:.1f} sites/minute"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate brochures for a list of company websites.")
+    parser.add_argument("urls", help="file with one url (or 'url,company name') per line")
+    parser.add_argument("--output", default="brochures.jsonl", help="JSONL results file, also used to resume")
+    parser.add_argument("--http-workers", type=int, default=32, help="concurrent page fetches")
+    parser.add_argument("--llm-workers", type=int, default=8, help="concurrent LLM calls")
+    parser.add_argument("--per-host-limit", type=int, default=2, help="concurrent fetches per host")
+    parser.add_argument("--cache-dir", default=".http_cache", help="HTTP cache directory ('' to disable)")
+    args = parser.parse_args()
+
+    run_batch(
+        read_sites(args.urls),
+        args.output,
+        http_workers=args.http_workers,
+        llm_workers=args.llm_workers,
+        per_host_limit=args.per_host_limit,
+        cache_dir=args.cache_dir,
+    )
@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from fetcher import Fetcher
+from website import Website
+
+
+class SiteCrawl:
+    """
+    Memoized crawl of one site for a single summary/brochure run.
+
+    Every URL is fetched at most once, even when requested concurrently, and
+    derived results such as the LLM link selection are cached with memoize()
+    so the summary, links and brochure steps can share them.
+    """
+
+    def __init__(self, url: str, fetcher: Fetcher = None) -> None:
+        self.url = url
+        self._own_fetcher = fetcher is None
+        self.fetcher = fetcher or Fetcher()
+        self._pages = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def submit(self, url: str) -> Future:
+        with self._lock:
+            if url not in self._pages:
+                self._pages[url] = self.fetcher.submit(url)
+            return self._pages[url]
+
+    def page(self, url: str) -> Website:
+        return self.submit(url).result()
+
+    @property
+    def landing_page(self) -> Website:
+        return self.page(self.url)
+
+    def fetch_all(self, urls: list[str]) -> list:
+        """
+        Fetch all urls concurrently, reusing pages already fetched. A failed
+        fetch yields its exception instead of a Website.
+        """
+        futures = [self.submit(url) for url in urls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def memoize(self, key: tuple, compute: Callable[[], object]) -> object:
+        """
+        Return the cached result for key, computing it on first use.
+        """
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            return self._results.setdefault(key, result)
+
+    def close(self) -> None:
+        if self._own_fetcher:
+            self.fetcher.close()
+
+    def __enter__(self) -> "SiteCrawl":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
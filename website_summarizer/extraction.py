@@ -0,0 +1,273 @@
+import codecs
+import glob
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+from typing import Iterable
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Tags whose contents are never part of the page text
+NOISE_TAGS = {"script", "style", "img", "input", "noscript", "template"}
+
+# Bytes searched for a byte order mark or a <meta charset> declaration
+SNIFF_BYTES = 4096
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9._:-]+)""", re.IGNORECASE)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def charset_from_content_type(content_type: str) -> str:
+    """
+    The charset parameter of a Content-Type header, or None when it has none.
+
+    Unlike requests' response.encoding, this does not default text/html to
+    ISO-8859-1, so the page's own declaration gets a say.
+    """
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        value = value.strip(" \"'")
+        if name.strip().lower() == "charset" and value:
+            return value
+    return None
+
+
+def sniff_encoding(head: bytes, declared: str = None) -> str:
+    """
+    Pick the codec of an HTML document from its first bytes.
+
+    A byte order mark wins, then the charset declared in the Content-Type
+    header, then a <meta charset> in the document. Without any of them the
+    head is tried as UTF-8, falling back to windows-1252.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    meta = META_CHARSET.search(head)
+    for encoding in (declared, meta and meta.group(1).decode("ascii")):
+        if encoding:
+            try:
+                name = codecs.lookup(encoding).name
+            except LookupError:
+                continue
+            # As in browsers, latin-1 and ascii labels are read as windows-1252
+            return "cp1252" if name in ("iso8859-1", "ascii") else name
+    try:
+        # final=False tolerates a multi-byte character cut at the end of the head
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def _walk_lxml(root) -> tuple[list[str], list[str]]:
+    """
+    Collect body text and link hrefs in one walk over an lxml tree, skipping
+    noise subtrees. An explicit stack keeps document order without recursion.
+    """
+    texts = []
+    links = []
+    stack = [(root, root.tag == "body")]
+    while stack:
+        node, in_body = stack.pop()
+        if isinstance(node, str):
+            if in_body:
+                stripped = node.strip()
+                if stripped:
+                    texts.append(stripped)
+            continue
+        tag = node.tag
+        # Comments and processing instructions have a callable tag; their tail is pushed by the parent
+        if not isinstance(tag, str) or tag in NOISE_TAGS:
+            continue
+        if tag == "a":
+            href = node.get("href")
+            if href:
+                links.append(href)
+        for child in reversed(node):
+            if child.tail:
+                stack.append((child.tail, in_body))
+            stack.append((child, in_body or child.tag == "body"))
+        if node.text:
+            stack.append((node.text, in_body))
+    return texts, links
+
+
+def _extract_lxml(content: bytes, text: bool = True, encoding: str = None) -> tuple[str, str, list[str]]:
+    try:
+        if encoding != "utf-8":
+            # libxml2 does not know every Python codec name, so other pages are transcoded
+            content = content.decode(encoding, errors="replace").encode("utf-8")
+        # Parsers are not shared between threads, so one is created per page
+        root = lxml.html.fromstring(content, parser=lxml.html.HTMLParser(encoding="utf-8"))
+    except Exception:
+        return "No title found", "" if text else None, []
+    title = root.find(".//title")
+    title = title.text_content() if title is not None else "No title found"
+    if not text:
+        # Same links as _walk_lxml: anchors inside noise subtrees are skipped
+        links = [
+            href
+            for href in (a.get("href") for a in root.iter("a") if next(a.iterancestors(*NOISE_TAGS), None) is None)
+            if href
+        ]
+        return title, None, links
+    texts, links = _walk_lxml(root)
+    return title, "\n".join(texts), links
+
+
+class StreamingExtractor(HTMLParser):
+    """
+    Event-based extractor on the standard library parser.
+
+    Text and links are collected while the document is fed, so very large
+    pages can be processed chunk by chunk without building a tree.
+    """
+
+    def __init__(self, collect_text: bool = True) -> None:
+        super().__init__(convert_charrefs=True)
+        self.collect_text = collect_text
+        self.title_parts = None
+        self.texts = []
+        self.links = []
+        self._in_title = False
+        self._in_body = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag == "a":
+            href = dict(attrs).get("href") if not self._skip_depth else None
+            if href:
+                self.links.append(href)
+        elif tag == "body":
+            self._in_body = True
+        elif tag == "title" and self.title_parts is None:
+            self._in_title = True
+            self.title_parts = []
+        elif tag in NOISE_TAGS and tag not in ("img", "input"):
+            # img and input are void elements and never get an end tag
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "title":
+            self._in_title = False
+        elif tag == "body":
+            self._in_body = False
+        elif tag in NOISE_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title_parts.append(data)
+        elif self.collect_text and self._in_body and not self._skip_depth:
+            stripped = data.strip()
+            if stripped:
+                self.texts.append(stripped)
+
+    def result(self) -> tuple[str, str, list[str]]:
+        title = "".join(self.title_parts) if self.title_parts is not None else "No title found"
+        return title, "\n".join(self.texts) if self.collect_text else None, self.links
+
+
+def extract_stream(
+    chunks: Iterable[bytes], encoding: str = None, text: bool = True
+) -> tuple[str, str, list[str]]:
+    """
+    Extract title, text and links from an iterable of raw byte chunks.
+
+    encoding is the charset declared by the server, if any; the document's
+    own byte order mark or <meta charset> is sniffed from its first chunks.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= SNIFF_BYTES:
+            break
+    decoder = codecs.getincrementaldecoder(sniff_encoding(head[:SNIFF_BYTES], encoding))(errors="replace")
+    extractor = StreamingExtractor(collect_text=text)
+    extractor.feed(decoder.decode(head))
+    for chunk in chunks:
+        extractor.feed(decoder.decode(chunk))
+    extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor.result()
+
+
+def extract(
+    content: bytes, engine: str = None, text: bool = True, encoding: str = None
+) -> tuple[str, str, list[str]]:
+    """
+    Extract (title, text, links) from an HTML document in a single pass.
+
+    Uses lxml when it is installed, otherwise the streaming extractor. With
+    text=False the text is not collected and None is returned in its place.
+    encoding is the charset declared by the server, if any (see sniff_encoding).
+    """
+    engine = engine or ("lxml" if lxml is not None else "stream")
+    if engine == "lxml":
+        return _extract_lxml(content, text, sniff_encoding(content[:SNIFF_BYTES], encoding))
+    if engine == "stream":
+        return extract_stream([content], encoding, text=text)
+    raise ValueError(f"Invalid extraction engine: {engine}. Choose between 'lxml' or 'stream'.")
+
+
+def _extract_bs4(content: bytes) -> tuple[str, str, list[str]]:
+    """
+    The original BeautifulSoup extraction, kept as the benchmark baseline.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+    title = soup.title.string if soup.title else "No title found"
+    text = ""
+    if soup.body:
+        for irrelevant in soup.body(["script", "style", "img", "input"]):
+            irrelevant.decompose()
+        text = soup.body.get_text(separator="\n", strip=True)
+    links = [link.get("href") for link in soup.find_all("a")]
+    return title, text, [link for link in links if link]
+
+
+def benchmark(fixture_dir: str = FIXTURE_DIR, repeat: int = 5) -> None:
+    """
+    Time each available engine over the saved .html files in fixture_dir.
+    """
+    paths = sorted(glob.glob(os.path.join(fixture_dir, "*.html")))
+    if not paths:
+        print(f"No .html fixtures found in {fixture_dir}")
+        return
+    pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    total_mb = sum(len(page) for page in pages) / 1e6
+
+    engines = {"stream": lambda page: extract(page, "stream")}
+    if lxml is not None:
+        engines["lxml"] = lambda page: extract(page, "lxml")
+    try:
+        import bs4  # noqa: F401
+
+        engines["bs4 html.parser"] = _extract_bs4
+    except ImportError:
+        pass
+
+    print(f"{len(pages)} fixtures, {total_mb:.2f} MB")
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in pages:
+                engine(page)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{name:>16}: {elapsed * 1000:.1f} ms per pass ({total_mb / elapsed:.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else FIXTURE_DIR)
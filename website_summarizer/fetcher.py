@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from http_cache import HttpCache
+from urllib3.util.retry import Retry
+from website import Website, headers
+
+
+def create_session(pool_size: int = 32, retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
+    """
+    Create a requests session with a keep-alive connection pool and retries
+    on connection errors and 429/5xx responses.
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class Fetcher:
+    """
+    Concurrent page fetcher sharing one pooled session.
+
+    Pages are fetched on a thread pool, with at most per_host_limit requests
+    in flight to any single host, through an optional HTTP cache.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session = None,
+        max_workers: int = 8,
+        per_host_limit: int = 4,
+        timeout: tuple[float, float] = (5, 20),
+        cache: HttpCache = None,
+    ) -> None:
+        self.cache = cache
+        self.session = session or create_session(pool_size=max_workers)
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url: str) -> threading.Semaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.Semaphore(self.per_host_limit)
+            return self._host_limits[host]
+
+    def fetch(self, url: str) -> Website:
+        with self._host_limit(url):
+            return Website(url, session=self.session, timeout=self.timeout, cache=self.cache).load()
+
+    def submit(self, url: str) -> Future:
+        return self._executor.submit(self.fetch, url)
+
+    def fetch_all(self, urls: list[str]) -> list:
+        """
+        Fetch all urls concurrently. Results are in input order; a failed
+        fetch yields its exception instead of a Website.
+        """
+        futures = [self.submit(url) for url in urls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self) -> "Fetcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
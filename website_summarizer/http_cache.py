@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+
+import requests
+
+
+def parse_cache_control(value: str) -> dict:
+    """
+    Parse a Cache-Control header into a dict of directives.
+    """
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or True
+    return directives
+
+
+class HttpCache:
+    """
+    On-disk HTTP cache for page fetches.
+
+    Bodies are stored zlib-compressed next to a JSON entry holding the
+    validators and the Content-Type, whose charset is needed to decode them. Fresh entries (Cache-Control max-age / Expires, or the ttl
+    override) are served without touching the network; stale ones are
+    revalidated with a conditional GET using ETag / Last-Modified.
+    """
+
+    def __init__(self, cache_dir: str = ".http_cache", ttl: float = None) -> None:
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.body")
+
+    def _load(self, url: str) -> tuple[dict, bytes]:
+        entry_path, body_path = self._paths(url)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            with open(body_path, "rb") as f:
+                body = zlib.decompress(f.read())
+            return entry, body
+        except (OSError, ValueError, zlib.error):
+            return None, None
+
+    def _write(self, path: str, data: bytes) -> None:
+        # A unique temporary file per write, renamed into place, so concurrent
+        # readers never see partial entries and concurrent writers never share a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _save(self, url: str, entry: dict, body: bytes = None) -> None:
+        entry_path, body_path = self._paths(url)
+        if body is not None:
+            self._write(body_path, zlib.compress(body, 6))
+        self._write(entry_path, json.dumps(entry).encode("utf-8"))
+
+    def _is_fresh(self, entry: dict) -> bool:
+        age = time.time() - entry["stored_at"]
+        if self.ttl is not None:
+            return age < self.ttl
+        cache_control = parse_cache_control(entry.get("cache_control"))
+        if "no-cache" in cache_control:
+            return False
+        if "max-age" in cache_control:
+            try:
+                return age < int(cache_control["max-age"])
+            except ValueError:
+                return False
+        if entry.get("expires"):
+            try:
+                return time.time() < parsedate_to_datetime(entry["expires"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _entry(response: requests.Response) -> dict:
+        return {
+            "url": response.url,
+            "stored_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "cache_control": response.headers.get("Cache-Control"),
+            "expires": response.headers.get("Expires"),
+            "content_type": response.headers.get("Content-Type"),
+        }
+
+    def get(
+        self,
+        url: str,
+        session: requests.Session = None,
+        headers: dict = None,
+        timeout: tuple[float, float] = None,
+    ) -> tuple[bytes, str]:
+        """
+        Return the body and Content-Type for url, from the cache when possible.
+        """
+        entry, body = self._load(url)
+        if entry is not None and self._is_fresh(entry):
+            with self._lock:
+                self.hits += 1
+            return body, entry.get("content_type")
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.get("etag"):
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = (session or requests).get(url, headers=request_headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            # Keep the old validators unless the server sent new ones
+            refreshed = self._entry(response)
+            for name in ("etag", "last_modified", "cache_control", "expires", "content_type"):
+                refreshed[name] = refreshed[name] or entry.get(name)
+            refreshed["url"] = entry["url"]
+            self._save(url, refreshed)
+            with self._lock:
+                self.revalidated += 1
+            return body, refreshed["content_type"]
+
+        body = response.content
+        with self._lock:
+            self.misses += 1
+            self.bytes_downloaded += len(body)
+        cache_control = parse_cache_control(response.headers.get("Cache-Control"))
+        if response.status_code == 200 and "no-store" not in cache_control:
+            self._save(url, self._entry(response), body)
+        return body, response.headers.get("Content-Type")
+
+    def stats(self) -> dict:
+        """
+        Hit-rate statistics; revalidated entries count as hits.
+        """
+        with self._lock:
+            total = self.hits + self.revalidated + self.misses
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.revalidated) / total if total else 0.0,
+                "bytes_downloaded": self.bytes_downloaded,
+            }
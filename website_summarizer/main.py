@@ -2,18 +2,24 @@ import os
 
 import requests
 from bs4 import BeautifulSoup
+from crawl import SiteCrawl
 from dotenv import load_dotenv
+from fetcher import Fetcher
+from http_cache import HttpCache
 from IPython.display import Markdown, display
 from openai import OpenAI
 from utils import *
-from website import Website
 
 # Based on: https://github.com/ed-donner/llm_engineering/blob/main/week1/day1.ipynb
 
 if __name__ == "__main__":
     WEBSITE_URL = "https://forbes.com/"
+    # Create a crawl that fetches each page once and is reused by every step below
+    # Pages are cached on disk, so repeat runs against an unchanged site barely touch the network
+    http_cache = HttpCache(".http_cache")
+    crawl = SiteCrawl(WEBSITE_URL, Fetcher(cache=http_cache))
     # Create a website object
-    website = Website(WEBSITE_URL)
+    website = crawl.landing_page
     # print("Title: ", website.title)
     # print("Text: ", website.text)
 
@@ -33,7 +39,8 @@ if __name__ == "__main__":
     # print("Response: ", response)
 
     # Configure the user prompt
-    user_prompt = configure_user_prompt(website)
+    summary_stats = {}
+    user_prompt = configure_user_prompt(website, stats=summary_stats)
     # print("User Prompt: ", user_prompt)
 
     # Configure the system prompt
@@ -46,7 +53,7 @@ if __name__ == "__main__":
     # print("Messages: ", messages)
 
     # Summarize the website
-    response = summarize_website(system_prompt, user_prompt)
+    response = summarize_website(system_prompt, user_prompt, stats=summary_stats)
     # print("Response: ", response)
 
     # ------------------------------------------ Part 2 ------------------------------------------#
@@ -73,12 +80,14 @@ if __name__ == "__main__":
     # print("User Prompt for Links: ", user_prompt_for_links)
 
     # Configure the system prompt for the useful links
-    useful_links_response = useful_links(system_prompt_for_links, user_prompt_for_links)
+    useful_links_response = useful_links(
+        system_prompt_for_links, user_prompt_for_links, crawl=crawl
+    )
     # print("Useful Links: ", useful_links_response)
 
     # Extract all details
     all_details = extract_all_details(
-        WEBSITE_URL, system_prompt_for_links, user_prompt_for_links
+        WEBSITE_URL, system_prompt_for_links, user_prompt_for_links, crawl=crawl
     )
     # print("All Details: ", all_details)
 
@@ -86,10 +95,21 @@ if __name__ == "__main__":
     and creates a short brochure about the company for prospective customers, investors and recruits. Respond in markdown.\
     Include details of company culture, customers and careers/jobs if you have the information."
 
+    brochure_stats = {}
     user_prompt = configure_user_prompt_brochure(
-        WEBSITE_URL, "Forbes", system_prompt_for_links, user_prompt_for_links
+        WEBSITE_URL,
+        "Forbes",
+        system_prompt_for_links,
+        user_prompt_for_links,
+        crawl=crawl,
+        stats=brochure_stats,
     )
     # print("User Prompt for Brochure: ", user_prompt)
 
-    brochure = create_brochure(system_prompt, user_prompt)
+    # Pages over the token budget are condensed with a map-reduce instead of being truncated
+    brochure = create_brochure(system_prompt, user_prompt, stats=brochure_stats)
     print("Brochure: ", brochure)
+    print("Brochure stages: ", brochure_stats)
+
+    crawl.fetcher.close()
+    print("HTTP cache: ", http_cache.stats())
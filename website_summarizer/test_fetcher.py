@@ -0,0 +1,159 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fetcher import Fetcher, create_session
+from http_cache import HttpCache
+
+PAGE = b"<html><head><title>Page</title></head><body><p>Hello</p><a href='/next'>next</a></body></html>"
+
+
+class FakeSite:
+    """
+    Counters shared by the handler threads of the test server.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.conditional = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive, so pooling is visible as reused sockets
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.site.lock:
+            self.server.site.connections += 1
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        site = self.server.site
+        with site.lock:
+            site.requests += 1
+            site.in_flight += 1
+            site.max_in_flight = max(site.max_in_flight, site.in_flight)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.05)
+                self._send(200, PAGE, {"Content-Type": "text/html; charset=utf-8"})
+            elif self.path == "/etag":
+                if self.headers.get("If-None-Match") == '"v1"':
+                    with site.lock:
+                        site.conditional += 1
+                    self._send(304, headers={"ETag": '"v1"'})
+                else:
+                    self._send(
+                        200,
+                        PAGE,
+                        {"Content-Type": "text/html; charset=utf-8", "ETag": '"v1"', "Cache-Control": "no-cache"},
+                    )
+            else:
+                self._send(404)
+        finally:
+            with site.lock:
+                site.in_flight -= 1
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.site = FakeSite()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def base_url(httpd) -> str:
+    return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def test_fetch_all_reuses_pooled_connections(server):
+    urls = [f"{base_url(server)}/slow/{i}" for i in range(24)]
+    with Fetcher(max_workers=4, per_host_limit=4) as fetcher:
+        results = fetcher.fetch_all(urls)
+
+    assert [website.title for website in results] == ["Page"] * len(urls)
+    assert server.site.requests == len(urls)
+    # One keep-alive connection per worker at most, not one per page
+    assert server.site.connections <= 4
+
+
+def test_fetch_all_respects_per_host_limit(server):
+    urls = [f"{base_url(server)}/slow/{i}" for i in range(16)]
+    with Fetcher(max_workers=8, per_host_limit=2) as fetcher:
+        results = fetcher.fetch_all(urls)
+
+    assert all(website.links == ["/next"] for website in results)
+    assert server.site.max_in_flight <= 2
+
+
+def test_fetch_all_returns_exceptions_in_order(server):
+    urls = [f"{base_url(server)}/slow/0", "http://127.0.0.1:1/unreachable"]
+    session = create_session(retries=0)
+    with Fetcher(session=session, max_workers=2) as fetcher:
+        results = fetcher.fetch_all(urls)
+
+    assert results[0].title == "Page"
+    assert isinstance(results[1], Exception)
+
+
+def test_http_cache_revalidates_with_304(server, tmp_path):
+    url = f"{base_url(server)}/etag"
+    cache = HttpCache(cache_dir=str(tmp_path))
+    session = create_session()
+
+    body, content_type = cache.get(url, session=session)
+    assert body == PAGE
+    assert cache.stats()["misses"] == 1
+
+    # no-cache makes the entry stale at once, so the next get revalidates
+    body, content_type = cache.get(url, session=session)
+    assert body == PAGE
+    assert content_type == "text/html; charset=utf-8"
+    assert server.site.conditional == 1
+    stats = cache.stats()
+    assert stats["revalidated"] == 1
+    assert stats["bytes_downloaded"] == len(PAGE)
+
+
+def test_http_cache_serves_fresh_entries_offline(server, tmp_path):
+    url = f"{base_url(server)}/etag"
+    cache = HttpCache(cache_dir=str(tmp_path), ttl=60)
+    session = create_session()
+
+    cache.get(url, session=session)
+    body, _ = cache.get(url, session=session)
+
+    assert body == PAGE
+    assert server.site.requests == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_fetcher_reads_pages_through_the_cache(server, tmp_path):
+    url = f"{base_url(server)}/etag"
+    cache = HttpCache(cache_dir=str(tmp_path))
+    with Fetcher(max_workers=2, cache=cache) as fetcher:
+        first, second = fetcher.fetch(url), fetcher.fetch(url)
+
+    assert first.title == second.title == "Page"
+    assert server.site.conditional == 1
@@ -1,9 +1,19 @@
 import json
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 import requests
+from crawl import SiteCrawl
 from dotenv import load_dotenv
+from fetcher import Fetcher
 from openai import OpenAI
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from response_cache import ResponseCache
+from tokens import count_tokens, split_by_tokens, truncate_to_tokens
 from website import Website
 
 # Load environment variables
@@ -12,6 +22,22 @@ api_key = os.environ.get("OPENAI_API_KEY")
 if not api_key:
     raise ValueError("OpenAI API key not found in environment variables")
 client = OpenAI(api_key=api_key)
+# Deterministic (temperature 0) completions are reused across runs
+response_cache = ResponseCache(".response_cache.db")
+
+# Page text beyond this many tokens is condensed with a map-reduce instead of being cut off
+PROMPT_TOKEN_BUDGET = 12_000
+
+PAGE_NOTES_PROMPT = (
+    "You are given part of the contents of a website. Extract its main content, including "
+    "any news or announcements, ignoring navigation text. Respond in concise markdown bullet points."
+)
+BROCHURE_NOTES_PROMPT = (
+    "You are given part of the contents of a company website. Extract the facts "
+    "that would be useful in a brochure about the company for prospective customers, "
+    "investors and recruits: what the company does, its customers, culture and careers. "
+    "Ignore navigation text. Respond in concise markdown bullet points."
+)
 
 
 def get_chat_completion(
@@ -31,6 +57,35 @@ def get_chat_completion(
     Returns:
         The completion text
     """
+    return get_chat_completion_with_usage(
+        messages, model, temperature, response_format
+    )[0]
+
+
+def get_chat_completion_with_usage(
+    messages: list[dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0,
+    response_format: dict = None,
+) -> tuple[str, dict]:
+    """
+    Get a chat completion from OpenAI along with its token usage.
+
+    Returns:
+        The completion text and a dict with prompt_tokens and completion_tokens
+    """
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "response_format": response_format,
+    }
+    cacheable = response_cache is not None and temperature == 0
+    if cacheable:
+        cached = response_cache.get(request)
+        if cached is not None:
+            return cached, {"prompt_tokens": 0, "completion_tokens": 0}
+
     try:
         response = client.chat.completions.create(
             model=model,
@@ -38,19 +93,33 @@ def get_chat_completion(
             temperature=temperature,
             response_format=response_format,
         )
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if cacheable:
+            response_cache.put(request, content)
+        usage = {
+            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+            "completion_tokens": (
+                response.usage.completion_tokens if response.usage else 0
+            ),
+        }
+        return content, usage
 
     except Exception as e:
         raise Exception(f"Error getting chat completion: {str(e)}")
 
 
-def configure_user_prompt(website: Website) -> str:
+def configure_user_prompt(website: Website, stats: dict = None) -> str:
+    # Reading text first extracts the title in the same pass
+    text = website.text
     user_prompt = f"You are looking at a website titled {website.title}"
 
     user_prompt += """\nThe contents of this website is as follows; \
                    please provide a short summary of this website in markdown. \
                    If it includes news or announcements, then summarize these too.\n\n"""
-    user_prompt += website.text
+    text, map_stats = condense_text(text, PAGE_NOTES_PROMPT)
+    if stats is not None:
+        stats.update(map_stats)
+    user_prompt += text
 
     return user_prompt
 
@@ -69,13 +138,20 @@ def configure_user_prompt_brochure(
     company_name: str,
     system_prompt_for_links: str,
     user_prompt_for_links: str,
+    crawl: SiteCrawl = None,
+    stats: dict = None,
+    llm_limit: threading.Semaphore = None,
 ) -> str:
     user_prompt = f"You are looking at a company called: {company_name}\n"
     user_prompt += f"Here are the contents of its landing page and other relevant pages; use this information to build a short brochure of the company in markdown.\n"
-    user_prompt += extract_all_details(
-        url, system_prompt_for_links, user_prompt_for_links
+    details = extract_all_details(
+        url, system_prompt_for_links, user_prompt_for_links, crawl=crawl
     )
-    user_prompt = user_prompt[:5_000]  # Truncate if more than 5,000 characters
+    # Pages over the budget are condensed to notes (map); create_brochure is the reduce
+    details, map_stats = condense_text(details, BROCHURE_NOTES_PROMPT, llm_limit=llm_limit)
+    if stats is not None:
+        stats.update(map_stats)
+    user_prompt += details
     return user_prompt
 
 
@@ -86,63 +162,194 @@ def configure_message(system_prompt: str, user_prompt: str) -> list[dict]:
     ]
 
 
-def summarize_website(system_prompt: str, user_prompt: str) -> str:
-    response = get_chat_completion(
-        messages=configure_message(system_prompt, user_prompt)
-    )
-    return response
+def summarize_website(system_prompt: str, user_prompt: str, stats: dict = None) -> str:
+    return reduce_completion(system_prompt, user_prompt, stats)
 
 
-def useful_links(system_prompt: str, user_prompt: str) -> str:
-    response = get_chat_completion(
-        messages=configure_message(system_prompt, user_prompt),
-        response_format={"type": "json_object"},
-    )
-    return response
+def useful_links(system_prompt: str, user_prompt: str, crawl: SiteCrawl = None) -> str:
+    def select_links() -> str:
+        return get_chat_completion(
+            messages=configure_message(system_prompt, user_prompt),
+            response_format={"type": "json_object"},
+        )
 
+    if crawl is None:
+        return select_links()
+    # Reuse the link selection already made during this crawl
+    return crawl.memoize(("useful_links", system_prompt, user_prompt), select_links)
 
-def extract_all_details(url: str, system_prompt: str, user_prompt: str) -> str:
+
+def extract_all_details(
+    url: str,
+    system_prompt: str,
+    user_prompt: str,
+    fetcher: Fetcher = None,
+    crawl: SiteCrawl = None,
+) -> str:
+    own_crawl = crawl is None
+    if own_crawl:
+        crawl = SiteCrawl(url, fetcher)
     try:
-        # Get main page content
-        result = "Landing page:\n"
-        main_page = Website(url)
-        result += main_page.get_contents()
-
-        # Get and process relevant links
-        links_response = useful_links(system_prompt, user_prompt)
-        links_data = (
-            json.loads(links_response)
-            if isinstance(links_response, str)
-            else links_response
+        return crawl.memoize(
+            ("details", url, system_prompt, user_prompt),
+            lambda: _extract_all_details(url, system_prompt, user_prompt, crawl),
         )
+    except Exception as e:
+        raise Exception(f"Error extracting website details: {str(e)}")
+    finally:
+        if own_crawl:
+            crawl.close()
+
 
-        if not links_data.get("links"):
-            print("No relevant links found")
-            return result
-
-        # Process each relevant link
-        for link in links_data["links"]:
-            try:
-                # print(f"Processing link: {link['url']}")
-                result += f"\n\n{link.get('type', 'Related Page')}:\n"
-                linked_page = Website(link["url"])
-                result += linked_page.get_contents()
-            except Exception as e:
-                print(f"Error processing link {link['url']}: {str(e)}")
-                continue
+def _extract_all_details(
+    url: str, system_prompt: str, user_prompt: str, crawl: SiteCrawl
+) -> str:
+    # Fetch the landing page while the LLM selects the relevant links
+    main_page_future = crawl.submit(url)
+    links_response = useful_links(system_prompt, user_prompt, crawl)
+
+    # Get main page content
+    result = "Landing page:\n"
+    result += main_page_future.result().get_contents()
+
+    # Get and process relevant links
+    links_data = (
+        json.loads(links_response)
+        if isinstance(links_response, str)
+        else links_response
+    )
+
+    if not links_data.get("links"):
+        print("No relevant links found")
         return result
 
-    except Exception as e:
-        raise Exception(f"Error extracting website details: {str(e)}")
+    # Fetch all relevant links concurrently, keeping the LLM's order
+    links = links_data["links"]
+    pages = crawl.fetch_all([link.get("url") for link in links])
+    for link, page in zip(links, pages):
+        if isinstance(page, Exception):
+            print(f"Error processing link {link.get('url')}: {str(page)}")
+            continue
+        result += f"\n\n{link.get('type', 'Related Page')}:\n"
+        result += page.get_contents()
+    return result
+
 
+def create_brochure(system_prompt: str, user_prompt: str, stats: dict = None) -> str:
+    return reduce_completion(system_prompt, user_prompt, stats)
 
-def create_brochure(system_prompt: str, user_prompt: str) -> str:
-    response = get_chat_completion(
-        messages=configure_message(system_prompt, user_prompt)
+
+def reduce_completion(system_prompt: str, user_prompt: str, stats: dict = None) -> str:
+    """
+    The final call of a map-reduce, recorded as the "reduce" stage in stats.
+    """
+    start = time.perf_counter()
+    response, usage = get_chat_completion_with_usage(
+        configure_message(system_prompt, user_prompt)
     )
+    entry = stage_stats([usage], start)
+    print_stage("reduce", entry)
+    if stats is not None:
+        stats["reduce"] = entry
     return response
 
 
+def stage_stats(usages: list[dict], start: float) -> dict:
+    return {
+        "calls": len(usages),
+        "prompt_tokens": sum(usage["prompt_tokens"] for usage in usages),
+        "completion_tokens": sum(usage["completion_tokens"] for usage in usages),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def print_stage(stage: str, entry: dict) -> None:
+    print(
+        f"{stage}: {entry['calls']} calls, {entry['prompt_tokens']} prompt + "
+        f"{entry['completion_tokens']} completion tokens, {entry['seconds']:.1f}s"
+    )
+
+
+def split_text_by_tokens(
+    text: str, max_tokens: int = 3_000, overlap: int = 100
+) -> list[str]:
+    """
+    Split text into chunks of at most max_tokens tokens, cutting on line
+    boundaries and repeating about overlap tokens between chunks. Lines
+    longer than max_tokens (pages without line breaks) are cut by tokens.
+    """
+    pieces = []
+    for line in text.splitlines():
+        if count_tokens(line) + 1 > max_tokens:
+            pieces.extend(split_by_tokens(line, max_tokens - 1))
+        else:
+            pieces.append(line)
+
+    chunks = []
+    lines, line_tokens = [], []
+    total = 0
+    for line in pieces:
+        tokens = count_tokens(line) + 1
+        if lines and total + tokens > max_tokens:
+            chunks.append("\n".join(lines))
+            # Carry the last lines over as overlap, as far as the next line still fits
+            while lines and (total > overlap or total + tokens > max_tokens):
+                total -= line_tokens.pop(0)
+                lines.pop(0)
+        lines.append(line)
+        line_tokens.append(tokens)
+        total += tokens
+    if lines:
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+def condense_text(
+    text: str,
+    map_system_prompt: str,
+    max_tokens: int = PROMPT_TOKEN_BUDGET,
+    chunk_tokens: int = 3_000,
+    max_workers: int = 8,
+    max_rounds: int = 3,
+    llm_limit: threading.Semaphore = None,
+) -> tuple[str, dict]:
+    """
+    Map step of a map-reduce: bring text of any length under max_tokens.
+
+    Text that already fits is returned as is. Otherwise token-sized chunks
+    are summarized concurrently with map_system_prompt, and the partial
+    summaries are collapsed again while they exceed max_tokens, for at most
+    max_rounds rounds; summaries that do not shrink enough are then
+    truncated. The caller makes the final (reduce) call on the result.
+    With llm_limit, every map call holds it, so callers sharing one
+    semaphore keep their total of concurrent LLM calls under its limit.
+
+    Returns:
+        The condensed text and per-round stats: calls, prompt/completion tokens and seconds
+    """
+    limit = llm_limit or nullcontext()
+
+    def summarize(chunk: str) -> tuple[str, dict]:
+        with limit:
+            return get_chat_completion_with_usage(configure_message(map_system_prompt, chunk))
+
+    stats = {}
+    while count_tokens(text) > max_tokens and len(stats) < max_rounds:
+        chunks = split_text_by_tokens(text, chunk_tokens)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(summarize, chunks))
+        stage = f"map {len(stats) + 1}"
+        stats[stage] = stage_stats([usage for _, usage in results], start)
+        print_stage(stage, stats[stage])
+        text = "\n\n".join(summary for summary, _ in results)
+
+    if count_tokens(text) > max_tokens:
+        print(f"Summaries still over {max_tokens} tokens after {len(stats)} rounds, truncating")
+        text = truncate_to_tokens(text, max_tokens)
+    return text, stats
+
+
 def check_ollama_model_exists(model_name: str) -> bool:
     """
     Check if the specified model is already downloaded in Ollama.
@@ -1,5 +1,8 @@
+import asyncio
+
 import requests
-from bs4 import BeautifulSoup
+from extraction import charset_from_content_type, extract, extract_stream
+from http_cache import HttpCache
 
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
@@ -9,31 +12,103 @@ headers = {
 class Website:
     """
     A class to represent a website.
+
+    Nothing is fetched on construction: the page is downloaded on first
+    access to title, text or links (or by load() / await fetch()), and each
+    of them is extracted on demand and cached. Asking only for links or the
+    title skips text extraction; asking for text extracts all three, so
+    callers that need the text should read it first.
     """
 
-    url: str = None
-    title: str = None
-    text: str = None
+    __slots__ = ("url", "session", "timeout", "cache", "stream", "_content", "_charset", "_title", "_text", "_links")
 
-    def __init__(self, url: str) -> None:
+    def __init__(
+        self,
+        url: str,
+        session: requests.Session = None,
+        timeout: tuple[float, float] = None,
+        cache: HttpCache = None,
+        stream: bool = False,
+    ) -> None:
         self.url = url
+        self.session = session
+        self.timeout = timeout
+        self.cache = cache
+        self.stream = stream
+        self._content = None
+        self._charset = None
+        self._title = None
+        self._text = None
+        self._links = None
 
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.content, "html.parser")
+    def load(self) -> "Website":
+        """
+        Fetch the page now if it has not been fetched yet.
+        """
+        if self._content is not None or self._text is not None:
+            return self
+        if self.cache is not None:
+            self._content, content_type = self.cache.get(
+                self.url, session=self.session, headers=headers, timeout=self.timeout
+            )
+            self._charset = charset_from_content_type(content_type)
+        elif self.stream:
+            # Parse very large pages incrementally as the body downloads, without keeping the raw page
+            with (self.session or requests).get(
+                self.url, headers=headers, timeout=self.timeout, stream=True
+            ) as response:
+                # response.encoding defaults to ISO-8859-1 for text/html, so only an explicit charset is passed
+                self._title, self._text, self._links = extract_stream(
+                    response.iter_content(chunk_size=65536),
+                    charset_from_content_type(response.headers.get("Content-Type")),
+                )
+        else:
+            response = (self.session or requests).get(self.url, headers=headers, timeout=self.timeout)
+            self._content = response.content
+            self._charset = charset_from_content_type(response.headers.get("Content-Type"))
+        return self
 
-        self.title = soup.title.string if soup.title else "No title found"
-        for irrelevant in soup.body(["script", "style", "img", "input"]):
-            irrelevant.decompose()
+    async def fetch(self) -> "Website":
+        """
+        Fetch the page in a worker thread, so many sites can be loaded concurrently.
+        """
+        return await asyncio.to_thread(self.load)
 
-        if soup.body:
-            for irrelevant in soup.body(["script", "style", "img", "input"]):
-                irrelevant.decompose()
-            self.text = soup.body.get_text(separator="\n", strip=True)
-        else:
-            self.text = ""
+    def _extract(self, text: bool) -> None:
+        self.load()
+        if text and self._text is None:
+            self._title, self._text, self._links = extract(self._content, encoding=self._charset)
+            # Everything has been extracted, so the raw page is no longer needed
+            self._content = None
+        elif self._links is None:
+            self._title, _, self._links = extract(self._content, text=False, encoding=self._charset)
+
+    @property
+    def title(self) -> str:
+        if self._title is None:
+            self._extract(text=False)
+        return self._title
 
-        links = [link.get("href") for link in soup.find_all("a")]
-        self.links = [link for link in links if link]
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._extract(text=True)
+        return self._text
+
+    @property
+    def links(self) -> list[str]:
+        if self._links is None:
+            self._extract(text=False)
+        return self._links
 
     def get_contents(self):
-        return f"Webpage Title:\n{self.title}\nWebpage Contents:\n{self.text}\n\n"
+        # Reading text first extracts title and links in the same pass
+        text = self.text
+        return f"Webpage Title:\n{self.title}\nWebpage Contents:\n{text}\n\n"
+
+
+async def fetch_websites(websites: list[Website]) -> list:
+    """
+    Fetch many websites concurrently. A failed fetch yields its exception.
+    """
+    return await asyncio.gather(*(website.fetch() for website in websites), return_exceptions=True)